@@ -1,3 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from . import models
+from . import report
+
+
+def _post_init_trigger_backfill(env):
+    """Dispara el backfill de montos en pesos apenas se instala el módulo."""
+    # Por qué: Las columnas stored se crean vacías en _auto_init(); sin esto
+    # quedarían en NULL (0 en listas y pivots) hasta la corrida diaria del cron
+    env.ref(env['account.move']._pesos_xmlid('ir_cron_backfill_amounts_pesos'))._trigger()
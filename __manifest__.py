@@ -1,6 +1,6 @@
 {
     'name': 'Reportes Dólar/Peso - Surtecnica',
-    'version': '17.0.1.0.0',
+    'version': '17.0.1.1.0',
     'category': 'Accounting',
     'summary': 'Imprime facturas y presupuestos en USD mostrando valores en pesos',
     'description': """
@@ -16,14 +16,25 @@
     # l10n_ar.report_invoice_document (primary=True), un template independiente
     'depends': ['purchase', 'account', 'sale', 'l10n_ar'],
     'data': [
-        'views/purchase_order_line_views.xml',
+        'security/ir.model.access.csv',
+        'security/pesos_security.xml',
+        'data/ir_cron_data.xml',
+        'data/mail_templates.xml',
+        'data/ir_actions_server_data.xml',
         'views/purchase_order_views.xml',
         'views/account_move_views.xml',
         'views/sale_order_views.xml',
+        'views/pesos_perf_stat_views.xml',
+        'views/pesos_line_export_views.xml',
         'report/account_move_report.xml',
         'report/purchase_order_report.xml',
         'report/sale_order_report.xml',
+        'report/pesos_print_reports.xml',
+        'report/purchase_line_pesos_report_views.xml',
+        'report/sale_line_pesos_report_views.xml',
+        'report/account_invoice_line_pesos_report_views.xml',
     ],
+    'post_init_hook': '_post_init_trigger_backfill',
     'installable': True,
     'application': False,
     'auto_install': False,
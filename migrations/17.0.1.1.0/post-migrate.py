@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    # Por qué: Al actualizar desde una versión sin montos en pesos stored, las
+    # columnas se crean vacías; disparamos el backfill en vez de esperar al cron diario
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env.ref(env['account.move']._pesos_xmlid('ir_cron_backfill_amounts_pesos'))._trigger()
@@ -1,5 +1,15 @@
 # -*- coding: utf-8 -*-
 
+from . import pesos_conversion_mixin
+from . import pesos_document_mixin
+from . import pesos_perf_stat
+from . import pesos_line_export
+from . import ir_attachment
+from . import res_currency
+from . import res_currency_rate
+from . import pesos_rate_snapshot
+from . import pesos_rate_correction
+from . import product_template
 from . import purchase_order_line
 from . import purchase_order
 from . import account_move
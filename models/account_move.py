@@ -1,12 +1,37 @@
 # -*- coding: utf-8 -*-
 
-import copy
-from odoo import api, fields, models
+import time
+from contextlib import contextmanager
+
+from odoo import Command, api, fields, models, tools
 from odoo.tools.misc import formatLang
+from odoo.tools.sql import column_exists, create_column
+
+from .pesos_perf_stat import pesos_perf, pesos_perf_cache
+
+# Por qué: Clave en cr.cache del payload del PDF en pesos (uno por documento y request)
+PESOS_REPORT_PAYLOAD_CACHE_KEY = 'surtecnica_pesos_report_payloads'
+
+# Por qué: Claves de la aplicación del TC manual en cr.cache: ids de facturas con
+# TC pendiente y profundidad de create/write anidados (cr.precommit.data se vacía
+# en cada savepoint, así que solo guarda si el hook de precommit está registrado)
+PESOS_RATE_DIRTY_KEY = 'surtecnica_pesos.manual_rate_dirty'
+PESOS_RATE_SCOPE_KEY = 'surtecnica_pesos.manual_rate_depth'
+# Campos de la factura que obligan a volver a aplicar el TC manual a las líneas
+PESOS_RATE_TRIGGER_FIELDS = {'manual_currency_rate', 'currency_id', 'date', 'invoice_date', 'line_ids', 'invoice_line_ids'}
+
+# Por qué: Tamaño de lote y tiempo máximo por corrida del backfill de montos en pesos.
+# Lotes acotados mantienen las transacciones cortas en tablas de millones de filas.
+PESOS_BACKFILL_BATCH_SIZE = 20000
+PESOS_BACKFILL_TIME_LIMIT = 600
 
 
 class AccountMove(models.Model):
-    _inherit = 'account.move'
+    _inherit = ['account.move', 'pesos.document.mixin']
+
+    _pesos_rate_summary_subject = "Validación con Tipo de Cambio"
+    _pesos_report_action = 'action_report_invoice_pesos'
+    _pesos_rate_date_sql = 'COALESCE(invoice_date, date)'
 
     # Por qué: Permite al usuario elegir imprimir en pesos aunque la factura sea en USD
     print_in_pesos = fields.Boolean(
@@ -29,19 +54,25 @@ class AccountMove(models.Model):
 
     # Por qué: Campos computados para mostrar valores en moneda de la compañía
     # Patrón: Computed fields con depends para recalcular cuando cambian los valores base
+    # store=True: permite agrupar, sumar y filtrar en pesos directamente en Postgres
+    # (pivots, listas y reportes) sin recalcular en Python en cada lectura
     amount_untaxed_pesos = fields.Monetary(
         string='Base Imponible (Pesos)',
         compute='_compute_amounts_pesos',
+        store=True,
         currency_field='company_currency_id',
     )
     amount_tax_pesos = fields.Monetary(
         string='Impuestos (Pesos)',
         compute='_compute_amounts_pesos',
+        store=True,
         currency_field='company_currency_id',
     )
     amount_total_pesos = fields.Monetary(
         string='Total (Pesos)',
         compute='_compute_amounts_pesos',
+        store=True,
+        index=True,
         currency_field='company_currency_id',
     )
 
@@ -51,249 +82,466 @@ class AccountMove(models.Model):
         for move in self:
             # Por qué: Solo actualizar si NO hay TC manual ya establecido (ej: viene del presupuesto)
             if not move.manual_currency_rate:
-                if move.currency_id and move.company_currency_id and move.currency_id != move.company_currency_id:
+                if move.is_foreign_currency:
                     # Por qué: Obtenemos el TC de la fecha actual
                     date = move.invoice_date or move.date or fields.Date.context_today(move)
                     # Convertimos 1 unidad de la moneda extranjera a pesos
-                    move.manual_currency_rate = move.currency_id._convert(
-                        1.0, move.company_currency_id, move.company_id, date)
+                    move.manual_currency_rate = move.currency_id._get_pesos_rate(
+                        move.company_currency_id, move.company_id, date)
                 else:
                     move.manual_currency_rate = 0.0
 
-    @api.depends('amount_untaxed', 'amount_tax', 'amount_total', 'currency_id', 'company_currency_id', 'invoice_date', 'date', 'manual_currency_rate')
+    @api.depends('amount_untaxed', 'amount_tax', 'amount_total', 'currency_id', 'company_currency_id', 'invoice_date', 'date', 'manual_currency_rate', 'pesos_frozen_rate')
     def _compute_amounts_pesos(self):
         """Calcula los montos en la moneda de la compañía usando la tasa manual o de la fecha de factura."""
-        for move in self:
-            if move.currency_id and move.company_currency_id and move.currency_id != move.company_currency_id:
-                # Por qué: Si hay TC manual, lo usamos; sino usamos el automático de la fecha
-                if move.manual_currency_rate:
-                    # Conversión manual directa multiplicando por el TC
-                    move.amount_untaxed_pesos = move.amount_untaxed * move.manual_currency_rate
-                    move.amount_tax_pesos = move.amount_tax * move.manual_currency_rate
-                    move.amount_total_pesos = move.amount_total * move.manual_currency_rate
-                else:
-                    # Conversión automática usando TC de la fecha
-                    date = move.invoice_date or move.date or fields.Date.context_today(move)
-                    move.amount_untaxed_pesos = move.currency_id._convert(
-                        move.amount_untaxed, move.company_currency_id, move.company_id, date)
-                    move.amount_tax_pesos = move.currency_id._convert(
-                        move.amount_tax, move.company_currency_id, move.company_id, date)
-                    move.amount_total_pesos = move.currency_id._convert(
-                        move.amount_total, move.company_currency_id, move.company_id, date)
-            else:
-                move.amount_untaxed_pesos = move.amount_untaxed
-                move.amount_tax_pesos = move.amount_tax
-                move.amount_total_pesos = move.amount_total
-
-    def action_toggle_print_pesos(self):
-        """Toggle para el smart button de impresión en pesos."""
-        for move in self:
-            move.print_in_pesos = not move.print_in_pesos
-
-    def _is_foreign_currency(self):
-        """Retorna True si la factura está en moneda extranjera."""
-        self.ensure_one()
-        return self.currency_id and self.company_currency_id and self.currency_id != self.company_currency_id
+        # Por qué: Conversión por lotes, un TC por grupo (moneda, compañía, fecha, TC manual)
+        self._compute_pesos_amounts_batch({
+            'amount_untaxed': 'amount_untaxed_pesos',
+            'amount_tax': 'amount_tax_pesos',
+            'amount_total': 'amount_total_pesos',
+        })
+
+    def _get_pesos_conversion_key(self):
+        """Clave de conversión: si hay TC manual se usa; sino el TC de la fecha de factura."""
+        return (
+            self.currency_id,
+            self.company_currency_id,
+            self.company_id,
+            self.invoice_date or self.date,
+            self.manual_currency_rate,
+            self.pesos_frozen_rate,
+        )
+
+    # ── Columnas stored y backfill ────────────────────────────────────────
+    # Por qué: Al agregar un campo stored computado, Odoo lo calcula vía ORM para
+    # todos los registros existentes durante la actualización del módulo. En bases
+    # con millones de asientos eso es inviable: creamos las columnas vacías y las
+    # completa _cron_backfill_amounts_pesos() por SQL y por lotes.
+    def _auto_init(self):
+        for column in ('amount_untaxed_pesos', 'amount_tax_pesos', 'amount_total_pesos'):
+            if not column_exists(self.env.cr, 'account_move', column):
+                create_column(self.env.cr, 'account_move', column, 'numeric')
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_amounts_pesos(self, last_id=0, batch_size=PESOS_BACKFILL_BATCH_SIZE):
+        """Completa por SQL los montos en pesos vacíos del siguiente lote de facturas.
+
+        Retorna el último id procesado, o 0 si no quedan registros.
+        """
+        self.env.cr.execute(
+            "SELECT id FROM account_move WHERE id > %s ORDER BY id LIMIT %s",
+            [last_id, batch_size],
+        )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        if not ids:
+            return 0
+        # Por qué: Misma regla que _compute_amounts_pesos: moneda local → 1,
+        # TC manual si existe, sino el TC de la fecha de factura; solo se
+        # redondea el TC de la fecha (rounded), igual que el cálculo por lotes
+        rate_sql = self.env['res.currency']._get_pesos_rate_sql(
+            'move.currency_id', 'company.currency_id', 'move.company_id',
+            'COALESCE(move.invoice_date, move.date)')
+        self.env.cr.execute(f"""
+            WITH conv AS (
+                SELECT move.id,
+                       CASE
+                           WHEN move.currency_id = company.currency_id THEN 1.0
+                           WHEN COALESCE(move.manual_currency_rate, 0) != 0 THEN move.manual_currency_rate
+                           WHEN COALESCE(move.pesos_frozen_rate, 0) != 0 THEN move.pesos_frozen_rate
+                           ELSE {rate_sql}
+                       END AS rate,
+                       move.currency_id != company.currency_id
+                           AND COALESCE(move.manual_currency_rate, 0) = 0 AS rounded,
+                       currency.decimal_places
+                  FROM account_move move
+                  JOIN res_company company ON company.id = move.company_id
+                  JOIN res_currency currency ON currency.id = company.currency_id
+                 WHERE move.id = ANY(%s)
+                   AND move.amount_total_pesos IS NULL
+            )
+            UPDATE account_move move
+               SET amount_untaxed_pesos = {self._get_pesos_backfill_amount_sql('move.amount_untaxed')},
+                   amount_tax_pesos = {self._get_pesos_backfill_amount_sql('move.amount_tax')},
+                   amount_total_pesos = {self._get_pesos_backfill_amount_sql('move.amount_total')}
+              FROM conv
+             WHERE move.id = conv.id
+        """, [ids])
+        self.invalidate_model(['amount_untaxed_pesos', 'amount_tax_pesos', 'amount_total_pesos'])
+        return ids[-1]
+
+    @api.model
+    def _get_pesos_backfill_amount_sql(self, amount):
+        """Expresión SQL del monto en pesos del backfill (usa el CTE conv)."""
+        return f"CASE WHEN conv.rounded THEN ROUND({amount} * conv.rate, conv.decimal_places) ELSE {amount} * conv.rate END"
+
+    @api.model
+    def _cron_backfill_amounts_pesos(self, batch_size=PESOS_BACKFILL_BATCH_SIZE, time_limit=PESOS_BACKFILL_TIME_LIMIT):
+        """Cron: completa los montos en pesos de facturas y líneas existentes.
+
+        Por qué: Procesa lotes confirmando cada uno; el progreso queda en
+        ir.config_parameter, así que puede cortarse y retomarse sin repetir trabajo.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        deadline = time.monotonic() + time_limit
+        for model in (self, self.env['account.move.line']):
+            param = f'surtecnica_pesos.backfill_last_id.{model._table}'
+            last_id = int(params.get_param(param, 0))
+            while True:
+                last_id = model._backfill_amounts_pesos(last_id, batch_size)
+                if not last_id:
+                    break
+                params.set_param(param, last_id)
+                self.env.cr.commit()
+                if time.monotonic() > deadline:
+                    # Tip: Quedan lotes pendientes, re-encolamos el cron para seguir enseguida
+                    self.env.ref(self._pesos_xmlid('ir_cron_backfill_amounts_pesos'))._trigger()
+                    return
+
+    def _get_pesos_rate_dependent_where(self):
+        # Por qué: Además de las congeladas, los borradores guardan sus montos en pesos
+        return "is_foreign_currency AND COALESCE(pesos_rate_source, 'auto') = 'auto'"
+
+    def _recompute_pesos_rate(self):
+        """Recongela las validadas y recalcula los montos stored de los borradores."""
+        super()._recompute_pesos_rate()
+        drafts = self.filtered(lambda move: not move.pesos_rate_source)
+        if drafts:
+            for name in ('amount_untaxed_pesos', 'amount_tax_pesos', 'amount_total_pesos'):
+                self.env.add_to_compute(self._fields[name], drafts)
+            lines = drafts.line_ids
+            for name in ('price_unit_pesos', 'price_subtotal_pesos'):
+                self.env.add_to_compute(lines._fields[name], lines)
+
+    def _post(self, soft=True):
+        """Override para aplicar el TC manual pendiente antes de validar."""
+        # Por qué: Los asientos se validan con los balances definitivos
+        self._flush_manual_currency_rate()
+        posted = super()._post(soft)
+        # Por qué: Un asiento validado no cambia su TC; lo congelamos con su origen
+        posted._freeze_pesos_rate()
+        return posted
+
+    def button_draft(self):
+        """Override para descongelar el TC al volver a borrador."""
+        result = super().button_draft()
+        self._unfreeze_pesos_rate()
+        return result
 
     def action_post(self):
         """Override para registrar TC en chatter al validar factura."""
         # Por qué: Ejecutar validación estándar primero
         result = super(AccountMove, self).action_post()
 
-        # Por qué: Registrar TC en chatter si es moneda extranjera
-        for move in self:
-            if move.manual_currency_rate and move._is_foreign_currency():
-                # Por qué: Diferentes estilos para facturas de cliente vs proveedor
-                if move.move_type in ('out_invoice', 'out_refund'):
-                    alert_class = 'alert-warning'
-                    icon = '📄'
-                    doc_type = 'Factura de Cliente'
-                else:
-                    alert_class = 'alert-info'
-                    icon = '📋'
-                    doc_type = 'Factura de Proveedor'
-
-                total_pesos = move.amount_total * move.manual_currency_rate
-                fecha = move.invoice_date.strftime('%d/%m/%Y') if move.invoice_date else (move.date.strftime('%d/%m/%Y') if move.date else 'N/A')
-
-                # Por qué: Usar Markup para que el HTML se renderice correctamente
-                from markupsafe import Markup
-
-                html_body = Markup(f"""<div class="alert {alert_class}" style="margin-bottom: 0;">
-    <h5>{icon} <strong>{doc_type} Validada</strong></h5>
-    <hr style="margin: 8px 0;"/>
-    <table class="table table-sm table-borderless" style="margin-bottom: 0;">
-        <tr>
-            <td style="width: 40%;"><strong>Tipo de Cambio:</strong></td>
-            <td><span class="badge badge-primary" style="font-size: 13px;">{move.manual_currency_rate:.4f}</span></td>
-        </tr>
-        <tr>
-            <td><strong>Conversión:</strong></td>
-            <td>{move.currency_id.name} → {move.company_currency_id.name}</td>
-        </tr>
-        <tr>
-            <td><strong>Fecha:</strong></td>
-            <td>{fecha}</td>
-        </tr>
-        <tr>
-            <td><strong>Total Original:</strong></td>
-            <td><strong>{move.currency_id.symbol} {move.amount_total:,.2f}</strong></td>
-        </tr>
-        <tr>
-            <td><strong>Total en Pesos:</strong></td>
-            <td><strong style="color: #28a745; font-size: 14px;">{move.company_currency_id.symbol} {total_pesos:,.2f}</strong></td>
-        </tr>
-    </table>
-</div>""")
-
-                move.message_post(
-                    body=html_body,
-                    subject="Validación con Tipo de Cambio"
-                )
+        # Por qué: Registrar TC en chatter si es moneda extranjera (en lote)
+        self._log_rate_summary()
 
         return result
 
+    def _get_rate_summary_values(self):
+        """Valores del resumen de TC al validar la factura."""
+        self.ensure_one()
+        values = self._get_rate_summary_common_values(self.invoice_date or self.date)
+        # Por qué: Diferentes estilos para facturas de cliente vs proveedor
+        if self.move_type in ('out_invoice', 'out_refund'):
+            values.update(alert_class='alert-warning', icon='📄', title='Factura de Cliente Validada')
+        else:
+            values.update(alert_class='alert-info', icon='📋', title='Factura de Proveedor Validada')
+        return values
+
     # ── Override create/write para aplicar TC manual ──────────────────────
-    # Por qué: Recalcular líneas contables cuando se crea/modifica con TC manual
+    # Por qué: create, write y el recálculo previo a validar rebalanceaban las
+    # mismas líneas cada uno a su manera (hasta tres veces por guardado).
+    # Patrón: Cada cambio relevante marca la factura como "TC pendiente" y un único
+    # paso idempotente la aplica al terminar el create/write de más afuera, antes
+    # de validar o, como red de seguridad, antes del commit.
     @api.model_create_multi
     def create(self, vals_list):
         """Override para aplicar TC manual después de crear la factura."""
-        # Por qué: Primero crear la factura normalmente
-        moves = super().create(vals_list)
-
-        # Por qué: Luego recalcular líneas que tienen TC manual
-        for move in moves:
-            if move.manual_currency_rate and move._is_foreign_currency():
-                move._apply_manual_currency_rate()
-
+        with self._manual_currency_rate_scope():
+            moves = super().create(vals_list)
+            moves._mark_manual_currency_rate_dirty()
         return moves
 
     def write(self, vals):
         """Override para aplicar TC manual cuando se modifica."""
-        result = super().write(vals)
-
-        # Por qué: Si se modificó el TC manual, recalcular las líneas
-        if 'manual_currency_rate' in vals:
-            for move in self:
-                if move.manual_currency_rate and move._is_foreign_currency():
-                    move._apply_manual_currency_rate()
-
+        self._check_pesos_rate_editable(vals)
+        with self._manual_currency_rate_scope():
+            result = super().write(vals)
+            if PESOS_RATE_TRIGGER_FIELDS.intersection(vals):
+                self._mark_manual_currency_rate_dirty()
+        # Por qué: write_date no cambia dentro de la misma transacción; descartamos
+        # los payloads del PDF ya calculados para no imprimir valores viejos
+        self.env.cr.cache.pop(PESOS_REPORT_PAYLOAD_CACHE_KEY, None)
         return result
 
+    @contextmanager
+    def _manual_currency_rate_scope(self):
+        """Aplica el TC manual pendiente al salir del create/write de más afuera."""
+        # Tip: La profundidad vive en cr.cache: los hooks de precommit (que también
+        # corren en cada savepoint) vacían cr.precommit.data a mitad de transacción
+        cache = self.env.cr.cache
+        cache[PESOS_RATE_SCOPE_KEY] = cache.get(PESOS_RATE_SCOPE_KEY, 0) + 1
+        try:
+            yield
+        finally:
+            cache[PESOS_RATE_SCOPE_KEY] -= 1
+        # Tip: Los create/write anidados (sincronización de líneas de Odoo) solo marcan
+        if not cache[PESOS_RATE_SCOPE_KEY]:
+            self._flush_manual_currency_rate()
+
+    def _mark_manual_currency_rate_dirty(self):
+        """Marca las facturas para aplicarles el TC manual una sola vez."""
+        # Tip: El write de _apply_manual_currency_rate no vuelve a marcar
+        if not self or self.env.context.get('pesos_applying_manual_rate'):
+            return
+        moves = self._filter_manual_currency_rate()
+        if not moves:
+            return
+        self.env.cr.cache.setdefault(PESOS_RATE_DIRTY_KEY, set()).update(moves.ids)
+        data = self.env.cr.precommit.data
+        if not data.get(PESOS_RATE_DIRTY_KEY):
+            data[PESOS_RATE_DIRTY_KEY] = True
+            # Por qué: Red de seguridad para cambios hechos fuera de create/write de
+            # la factura (por ejemplo, escribiendo directamente en las líneas)
+            self.env.cr.precommit.add(self.browse()._precommit_flush_manual_currency_rate)
+
+    def _flush_manual_currency_rate(self):
+        """Aplica el TC manual a las facturas marcadas como pendientes."""
+        dirty = self.env.cr.cache.get(PESOS_RATE_DIRTY_KEY)
+        if not dirty:
+            return
+        moves = self.browse(dirty).exists()
+        dirty.clear()
+        moves._filter_manual_currency_rate()._apply_manual_currency_rate()
+
+    def _filter_manual_currency_rate(self):
+        """Retorna las facturas en borrador a las que aplica el TC manual."""
+        # Por qué: Pagos, conciliaciones y valoración de stock escriben líneas todo el
+        # tiempo; solo las facturas en moneda extranjera con TC manual nos interesan
+        return self.filtered(lambda m: m.manual_currency_rate and m.is_foreign_currency and m.state == 'draft')
+
+    def _precommit_flush_manual_currency_rate(self):
+        # Por qué: Los savepoints también corren los hooks de precommit; si hay un
+        # create/write de factura en curso, no rebalanceamos a mitad de camino:
+        # lo aplica el scope al salir (los ids pendientes siguen en cr.cache)
+        if self.env.cr.cache.get(PESOS_RATE_SCOPE_KEY, 0) > 0:
+            return
+        self._flush_manual_currency_rate()
+        # Por qué: El ORM ya se vació antes de los hooks de precommit
+        self.env.flush_all()
+
+    @pesos_perf('apply_manual_currency_rate')
     def _apply_manual_currency_rate(self):
-        """Aplica el TC manual a todas las líneas contables del move."""
-        self.ensure_one()
-        # Por qué: Recalcular balance de las líneas con amount_currency
-        # Patrón: Usar with_context para evitar recursiones y write para triggear recálculos
-        for line in self.line_ids.filtered(lambda l: l.amount_currency and l.currency_id == self.currency_id):
-            # Por qué: Convertir amount_currency a moneda de compañía con TC manual
-            balance = line.amount_currency * self.manual_currency_rate
-            # Tip: Escribir solo balance, debit/credit se recalculan automáticamente
-            line.with_context(check_move_validity=False).write({
-                'balance': balance,
-            })
+        """Aplica el TC manual a todas las líneas contables de los moves."""
+        # Por qué: Escribir línea por línea dispara la sincronización de líneas
+        # dinámicas y el chequeo de balance una vez por línea (lento en facturas
+        # de cientos de líneas). Hacemos un único write sobre todos los moves con
+        # comandos sobre line_ids: la cascada corre una sola vez para el lote
+        # (por ejemplo, todas las facturas de proveedor creadas desde varias órdenes).
+        # Tip: Los Command.update se aplican una sola vez aunque el write sea multi-registro
+        moves = self.browse()
+        commands = []
+        for move in self:
+            company_currency = move.company_currency_id
+            move_commands = []
+            for line in move.line_ids:
+                if not line.amount_currency or line.currency_id != move.currency_id:
+                    continue
+                # Por qué: Convertir amount_currency a moneda de compañía con TC manual
+                balance = company_currency.round(line.amount_currency * move.manual_currency_rate)
+                # Tip: Omitimos las líneas que ya tienen el balance correcto
+                if company_currency.compare_amounts(balance, line.balance):
+                    # Tip: Escribir solo balance, debit/credit se recalculan automáticamente
+                    move_commands.append(Command.update(line.id, {'balance': balance}))
+            if move_commands:
+                moves |= move
+                commands += move_commands
+        if commands:
+            # Patrón: check_move_validity=False porque el redondeo por línea puede
+            # dejar centavos de diferencia que Odoo no debe rechazar a mitad de camino
+            moves.with_context(check_move_validity=False, pesos_applying_manual_rate=True).write({'line_ids': commands})
 
     # ── Override l10n_ar ──────────────────────────────────────────────────
     # Por qué: l10n_ar.report_invoice_document (primary=True) usa este método
-    # para obtener el dict de totales del reporte. Si print_in_pesos está activo,
-    # interceptamos y devolvemos la versión convertida a pesos.
+    # para obtener el dict de totales del reporte. Si se imprime en pesos,
+    # devolvemos los totales ya convertidos del payload del reporte.
+    # Tip: El contexto pesos_report_raw pide los valores originales (los usa el payload)
+    @pesos_perf('l10n_ar_invoice_totals')
     def _l10n_ar_get_invoice_totals_for_report(self):
-        result = super()._l10n_ar_get_invoice_totals_for_report()
-        if self.print_in_pesos and self._is_foreign_currency():
-            return self._convert_tax_totals_to_pesos(result)
-        return result
+        if not self.env.context.get('pesos_report_raw'):
+            payload = self._get_pesos_report_payload()
+            if payload['active']:
+                return payload['totals']
+        return super()._l10n_ar_get_invoice_totals_for_report()
+
+    # ── Payload del PDF en pesos ──────────────────────────────────────────
+    # Por qué: El template evaluaba la condición de impresión en pesos y
+    # convertía pagos, residual, totales y cada línea mientras renderizaba.
+    # Patrón: Calculamos todo una sola vez por documento y el template solo lee.
+    @pesos_perf('report_payload')
+    def _get_pesos_report_payload(self):
+        """Retorna los valores del PDF en pesos del documento, calculados una vez por request.
+
+        Claves: active, currency, rate, lines ({id línea: dict l10n_ar}), totals,
+        payments (lista alineada con el widget de pagos) y amount_residual.
+        """
+        self.ensure_one()
+        cache = self.env.cr.cache.setdefault(PESOS_REPORT_PAYLOAD_CACHE_KEY, {})
+        key = (self.id, self.write_date, self._is_pesos_print(), self.manual_currency_rate, self.env.lang)
+        pesos_perf_cache(self.env, 'report_payload', key in cache)
+        if key not in cache:
+            cache[key] = self._prepare_pesos_report_payload()
+        return cache[key]
+
+    def _prepare_pesos_report_payload(self):
+        """Arma el payload del PDF en pesos (ver _get_pesos_report_payload)."""
+        self.ensure_one()
+        if not self._is_pesos_print():
+            return {'active': False, 'currency': self.currency_id}
+
+        raw_self = self.with_context(pesos_report_raw=True)
+        lines = {}
+        for line in raw_self.invoice_line_ids.filtered(lambda l: l.display_type == 'product'):
+            lines[line.id] = line._convert_l10n_ar_prices_to_pesos(line._l10n_ar_prices_and_taxes())
+
+        payments_widget = self.sudo().invoice_payments_widget
+        payments = [
+            self._convert_amount_to_pesos(payment_vals['amount'])
+            for payment_vals in (payments_widget and payments_widget['content'] or [])
+        ]
+        return {
+            'active': True,
+            'currency': self.company_currency_id,
+            'rate': self.manual_currency_rate,
+            'lines': lines,
+            'totals': self._get_tax_totals_pesos_cached('l10n_ar'),
+            'payments': payments,
+            'amount_residual': self._convert_amount_to_pesos(self.amount_residual),
+        }
+
+    def _get_pesos_report_rate(self):
+        """Retorna el TC del documento: el manual o el automático de la fecha de factura."""
+        self.ensure_one()
+        # Por qué: Si hay TC manual, lo usamos para la conversión; sino usamos el TC nativo de Odoo
+        if self.manual_currency_rate:
+            return self.manual_currency_rate
+        # Tip: En facturas validadas el TC congelado evita toda búsqueda de tasas
+        if self.pesos_frozen_rate:
+            return self.pesos_frozen_rate
+        # Por qué: Usamos invoice_date (fecha del comprobante) para tomar el TC del día de emisión
+        date = self.invoice_date or self.date or fields.Date.context_today(self)
+        return self.currency_id._get_pesos_rate(self.company_currency_id, self.company_id, date)
+
+    def _convert_amount_to_pesos(self, amount):
+        """Convierte un monto del documento a pesos con el TC manual o el de la fecha de factura."""
+        self.ensure_one()
+        amount = amount * self._get_pesos_report_rate()
+        # Tip: Con TC manual no redondeamos; el automático (congelado o no) sí,
+        # igual que _compute_pesos_amounts_batch
+        if self.manual_currency_rate:
+            return amount
+        return self.company_currency_id.round(amount)
 
     # ── Conversión de totales ─────────────────────────────────────────────
+    @pesos_perf('convert_tax_totals')
     def _convert_tax_totals_to_pesos(self, tax_totals_dict):
         """Convierte cualquier dict de tax_totals a moneda de la compañía.
 
         Por qué: Método reutilizable que sirve tanto para el override de l10n_ar
         como para el wrapper _get_tax_totals_pesos().
-        Patrón: Deep copy para no mutar el dict original.
+        Patrón: Copia superficial; solo se arman dicts nuevos para las claves que
+        cambian, el resto se comparte con el original (que no se muta).
         """
         self.ensure_one()
-        tax_totals = copy.deepcopy(tax_totals_dict)
-        if not tax_totals:
-            return tax_totals
+        if not tax_totals_dict:
+            return tax_totals_dict
 
-        currency = self.currency_id
         company_currency = self.company_currency_id
-        company = self.company_id
-        # Por qué: Usamos invoice_date (fecha del comprobante) para tomar el TC del día de emisión
-        date = self.invoice_date or self.date or fields.Date.context_today(self)
+        rate = self._get_pesos_report_rate()
+        manual_rate = self.manual_currency_rate
+        formatted = {}
 
         def convert(amount):
-            # Por qué: Si hay TC manual, lo usamos para la conversión; sino usamos el TC nativo de Odoo
-            if self.manual_currency_rate:
-                return amount * self.manual_currency_rate
-            return currency._convert(amount, company_currency, company, date)
+            # Tip: Mismo resultado que _convert_amount_to_pesos(), con el TC resuelto una vez
+            return amount * rate if manual_rate else company_currency.round(amount * rate)
 
         def fmt(amount):
-            return formatLang(self.env, amount, currency_obj=company_currency)
+            # Por qué: Base, subtotal y total suelen repetir montos; formatLang es lo caro
+            if amount not in formatted:
+                formatted[amount] = formatLang(self.env, amount, currency_obj=company_currency)
+            return formatted[amount]
+
+        def convert_keys(values, keys, drop=()):
+            result = {key: value for key, value in values.items() if key not in drop}
+            for key, formatted_key in keys:
+                if key in values:
+                    result[key] = convert(values[key])
+                    result[formatted_key] = fmt(result[key])
+            return result
 
         # Totales globales
-        if 'amount_total' in tax_totals:
-            tax_totals['amount_total'] = convert(tax_totals['amount_total'])
-            tax_totals['formatted_amount_total'] = fmt(tax_totals['amount_total'])
-
-        if 'amount_untaxed' in tax_totals:
-            tax_totals['amount_untaxed'] = convert(tax_totals['amount_untaxed'])
-            tax_totals['formatted_amount_untaxed'] = fmt(tax_totals['amount_untaxed'])
+        tax_totals = convert_keys(tax_totals_dict, (
+            ('amount_total', 'formatted_amount_total'),
+            ('amount_untaxed', 'formatted_amount_untaxed'),
+        ))
 
         # Subtotales (base imponible por grupo)
-        for subtotal in tax_totals.get('subtotals', []):
-            subtotal['amount'] = convert(subtotal['amount'])
-            subtotal['formatted_amount'] = fmt(subtotal['amount'])
-            subtotal.pop('amount_company_currency', None)
+        if 'subtotals' in tax_totals_dict:
+            tax_totals['subtotals'] = [
+                convert_keys(subtotal, (('amount', 'formatted_amount'),), drop=('amount_company_currency',))
+                for subtotal in tax_totals_dict['subtotals']
+            ]
 
         # Grupos de impuestos
-        for groups in tax_totals.get('groups_by_subtotal', {}).values():
-            for group in groups:
-                if 'tax_group_amount' in group:
-                    group['tax_group_amount'] = convert(group['tax_group_amount'])
-                    group['formatted_tax_group_amount'] = fmt(group['tax_group_amount'])
-                if 'tax_group_base_amount' in group:
-                    group['tax_group_base_amount'] = convert(group['tax_group_base_amount'])
-                    group['formatted_tax_group_base_amount'] = fmt(group['tax_group_base_amount'])
-                group.pop('tax_group_amount_company_currency', None)
-                group.pop('tax_group_base_amount_company_currency', None)
+        if 'groups_by_subtotal' in tax_totals_dict:
+            group_keys = (
+                ('tax_group_amount', 'formatted_tax_group_amount'),
+                ('tax_group_base_amount', 'formatted_tax_group_base_amount'),
+            )
+            group_drop = ('tax_group_amount_company_currency', 'tax_group_base_amount_company_currency')
+            tax_totals['groups_by_subtotal'] = {
+                subtotal_name: [convert_keys(group, group_keys, drop=group_drop) for group in groups]
+                for subtotal_name, groups in tax_totals_dict['groups_by_subtotal'].items()
+            }
 
         # Por qué: Detalle de impuestos argentinos (RG 5614/2024 - Transparencia Fiscal)
-        for detail in tax_totals.get('detail_ar_tax', []):
-            if 'amount_tax' in detail:
-                detail['amount_tax'] = convert(detail['amount_tax'])
-                detail['formatted_amount_tax'] = fmt(detail['amount_tax'])
+        if 'detail_ar_tax' in tax_totals_dict:
+            tax_totals['detail_ar_tax'] = [
+                convert_keys(detail, (('amount_tax', 'formatted_amount_tax'),))
+                for detail in tax_totals_dict['detail_ar_tax']
+            ]
 
         return tax_totals
 
     def _get_tax_totals_pesos(self):
         """Wrapper de compatibilidad: convierte tax_totals estándar a pesos."""
         self.ensure_one()
-        return self._convert_tax_totals_to_pesos(self.tax_totals or {})
+        return self._get_tax_totals_pesos_cached('tax_totals')
 
-    # ── Override para registración contable con TC manual ─────────────────
-    # Por qué: Recalcular debit/credit de las líneas usando TC manual antes de validar
-    # Patrón: _recompute_dynamic_lines se llama antes de post para recalcular todo
-    def _recompute_dynamic_lines(self, recompute_all_taxes=False, recompute_tax_base_amount=False):
-        """Override para aplicar TC manual a las líneas contables."""
-        # Por qué: Primero ejecutar el comportamiento estándar de Odoo
-        result = super()._recompute_dynamic_lines(recompute_all_taxes, recompute_tax_base_amount)
+    # Por qué: Cada render del PDF (y cada vista previa del portal) volvía a
+    # convertir y formatear los mismos totales de la misma factura.
+    # Patrón: ormcache por (factura, write_date, TC, idioma), compartido entre requests.
+    # Tip: Solo cacheamos facturas publicadas; en borrador write_date no cambia
+    # dentro de la transacción y podríamos devolver totales viejos.
+    def _get_tax_totals_pesos_cached(self, source):
+        """Retorna los totales en pesos del documento ('l10n_ar' o 'tax_totals').
 
-        # Por qué: Si hay TC manual, recalcular debit/credit de las líneas en moneda extranjera
-        for move in self:
-            if move.manual_currency_rate and move._is_foreign_currency():
-                # Por qué: Recalcular solo las líneas con amount_currency (en USD)
-                for line in move.line_ids.filtered(lambda l: l.amount_currency and l.currency_id == move.currency_id):
-                    # Por qué: Convertir amount_currency a moneda de compañía con TC manual
-                    amount_company_currency = line.amount_currency * move.manual_currency_rate
-                    # Tip: Asignación directa evita recursión, debit/credit según el signo
-                    if amount_company_currency > 0:
-                        line.debit = amount_company_currency
-                        line.credit = 0.0
-                    else:
-                        line.debit = 0.0
-                        line.credit = -amount_company_currency
-                    # Por qué: balance es debit - credit
-                    line.balance = line.debit - line.credit
-
-        return result
+        El dict retornado puede estar compartido: no debe mutarse.
+        """
+        self.ensure_one()
+        if self.state != 'posted' or not self.id:
+            return self._compute_tax_totals_pesos(source)
+        return self._get_tax_totals_pesos_ormcached(
+            self.write_date, self._get_pesos_report_rate(), self.env.lang, source)
+
+    @tools.ormcache('self.id', 'write_date', 'rate', 'lang', 'source')
+    def _get_tax_totals_pesos_ormcached(self, write_date, rate, lang, source):
+        return self._compute_tax_totals_pesos(source)
+
+    def _compute_tax_totals_pesos(self, source):
+        if source == 'l10n_ar':
+            tax_totals = self.with_context(pesos_report_raw=True)._l10n_ar_get_invoice_totals_for_report()
+        else:
+            tax_totals = self.tax_totals or {}
+        return self._convert_tax_totals_to_pesos(tax_totals)
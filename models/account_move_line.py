@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from odoo import api, fields, models
+from odoo.tools.sql import column_exists, create_column
+
+from .account_move import PESOS_BACKFILL_BATCH_SIZE
+from .pesos_perf_stat import pesos_perf
+
+# Campos de la línea que obligan a volver a aplicar el TC manual de la factura
+PESOS_RATE_LINE_TRIGGER_FIELDS = {'amount_currency', 'currency_id', 'price_unit', 'quantity', 'discount', 'tax_ids'}
 
 
 class AccountMoveLine(models.Model):
-    _inherit = 'account.move.line'
+    _inherit = ['account.move.line', 'pesos.conversion.mixin']
 
     # Por qué: Campo relacionado necesario para los campos Monetary que usan currency_field
     company_currency_id = fields.Many2one(
@@ -15,59 +22,143 @@ class AccountMoveLine(models.Model):
     )
 
     # Por qué: Campos para mostrar precio unitario y subtotal en pesos en el PDF
+    # store=True: los reportes en pesos agregan millones de líneas en Postgres
     price_unit_pesos = fields.Monetary(
         string='Precio Unit. (Pesos)',
         compute='_compute_amounts_pesos',
+        store=True,
         currency_field='company_currency_id',
     )
     price_subtotal_pesos = fields.Monetary(
         string='Subtotal (Pesos)',
         compute='_compute_amounts_pesos',
+        store=True,
+        index=True,
         currency_field='company_currency_id',
     )
 
-    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_currency_id', 'move_id.invoice_date', 'move_id.date', 'move_id.manual_currency_rate')
+    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_currency_id', 'move_id.invoice_date', 'move_id.date', 'move_id.manual_currency_rate', 'move_id.pesos_frozen_rate')
     def _compute_amounts_pesos(self):
         """Calcula precio unitario y subtotal en moneda de la compañía."""
-        for line in self:
-            if line.currency_id and line.company_currency_id and line.currency_id != line.company_currency_id:
-                # Por qué: Si hay TC manual, lo usamos; sino usamos el TC automático de la fecha
-                if line.move_id.manual_currency_rate:
-                    line.price_unit_pesos = line.price_unit * line.move_id.manual_currency_rate
-                    line.price_subtotal_pesos = line.price_subtotal * line.move_id.manual_currency_rate
-                else:
-                    date = line.move_id.invoice_date or line.move_id.date or fields.Date.context_today(line)
-                    line.price_unit_pesos = line.currency_id._convert(
-                        line.price_unit, line.company_currency_id, line.company_id, date)
-                    line.price_subtotal_pesos = line.currency_id._convert(
-                        line.price_subtotal, line.company_currency_id, line.company_id, date)
-            else:
-                line.price_unit_pesos = line.price_unit
-                line.price_subtotal_pesos = line.price_subtotal
+        # Por qué: Conversión por lotes; las líneas de una misma factura comparten un solo TC
+        self._compute_pesos_amounts_batch({
+            'price_unit': 'price_unit_pesos',
+            'price_subtotal': 'price_subtotal_pesos',
+        })
+
+    def _get_pesos_conversion_key(self):
+        """Clave de conversión: si hay TC manual en la factura se usa; sino el TC de la fecha."""
+        move = self.move_id
+        return (
+            self.currency_id,
+            self.company_currency_id,
+            self.company_id,
+            move.invoice_date or move.date,
+            move.manual_currency_rate,
+            move.pesos_frozen_rate,
+        )
+
+    # ── TC manual ─────────────────────────────────────────────────────────
+    # Por qué: Cambios hechos directamente en las líneas también dejan la factura
+    # con el TC pendiente; se aplica una vez al final (ver AccountMove.create/write)
+    # Tip: Solo se abre el scope si alguna factura de las líneas usa TC manual
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = self.env['account.move'].browse(
+            {vals['move_id'] for vals in vals_list if vals.get('move_id')}
+        )._filter_manual_currency_rate()
+        if not moves:
+            return super().create(vals_list)
+        with moves._manual_currency_rate_scope():
+            lines = super().create(vals_list)
+            lines.move_id._mark_manual_currency_rate_dirty()
+        return lines
+
+    def write(self, vals):
+        if not PESOS_RATE_LINE_TRIGGER_FIELDS.intersection(vals):
+            return super().write(vals)
+        moves = self.move_id._filter_manual_currency_rate()
+        if not moves:
+            return super().write(vals)
+        with moves._manual_currency_rate_scope():
+            result = super().write(vals)
+            self.move_id._mark_manual_currency_rate_dirty()
+        return result
+
+    # ── Columnas stored y backfill ────────────────────────────────────────
+    # Por qué: Igual que en account.move, evitamos el cálculo ORM masivo al
+    # actualizar el módulo; las columnas las completa el backfill por lotes.
+    def _auto_init(self):
+        for column in ('price_unit_pesos', 'price_subtotal_pesos'):
+            if not column_exists(self.env.cr, 'account_move_line', column):
+                create_column(self.env.cr, 'account_move_line', column, 'numeric')
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_amounts_pesos(self, last_id=0, batch_size=PESOS_BACKFILL_BATCH_SIZE):
+        """Completa por SQL los montos en pesos vacíos del siguiente lote de líneas.
+
+        Retorna el último id procesado, o 0 si no quedan registros.
+        """
+        self.env.cr.execute(
+            "SELECT id FROM account_move_line WHERE id > %s ORDER BY id LIMIT %s",
+            [last_id, batch_size],
+        )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        if not ids:
+            return 0
+        rate_sql = self.env['res.currency']._get_pesos_rate_sql(
+            'line.currency_id', 'company.currency_id', 'line.company_id',
+            'COALESCE(move.invoice_date, move.date)')
+        self.env.cr.execute(f"""
+            WITH conv AS (
+                SELECT line.id,
+                       CASE
+                           WHEN line.currency_id = company.currency_id THEN 1.0
+                           WHEN COALESCE(move.manual_currency_rate, 0) != 0 THEN move.manual_currency_rate
+                           WHEN COALESCE(move.pesos_frozen_rate, 0) != 0 THEN move.pesos_frozen_rate
+                           ELSE {rate_sql}
+                       END AS rate,
+                       line.currency_id != company.currency_id
+                           AND COALESCE(move.manual_currency_rate, 0) = 0 AS rounded,
+                       currency.decimal_places
+                  FROM account_move_line line
+                  JOIN account_move move ON move.id = line.move_id
+                  JOIN res_company company ON company.id = line.company_id
+                  JOIN res_currency currency ON currency.id = company.currency_id
+                 WHERE line.id = ANY(%s)
+                   AND line.price_subtotal_pesos IS NULL
+            )
+            UPDATE account_move_line line
+               SET price_unit_pesos = {self.env['account.move']._get_pesos_backfill_amount_sql('line.price_unit')},
+                   price_subtotal_pesos = {self.env['account.move']._get_pesos_backfill_amount_sql('line.price_subtotal')}
+              FROM conv
+             WHERE line.id = conv.id
+        """, [ids])
+        self.invalidate_model(['price_unit_pesos', 'price_subtotal_pesos'])
+        return ids[-1]
 
     # ── Override l10n_ar ──────────────────────────────────────────────────
     # Por qué: l10n_ar reemplaza los spans de precio/subtotal con valores de
     # _l10n_ar_prices_and_taxes() (incluye/excluye IVA según reglas AR).
     # El template usa estos valores para display Y para current_subtotal.
     # Al convertir aquí, todo queda consistente (precios + subtotales acumulados).
+    # Tip: Los valores convertidos salen del payload del reporte, calculado una vez por factura
+    @pesos_perf('l10n_ar_prices_and_taxes')
     def _l10n_ar_prices_and_taxes(self):
-        result = super()._l10n_ar_prices_and_taxes()
+        if not self.env.context.get('pesos_report_raw'):
+            payload = self.move_id._get_pesos_report_payload()
+            if payload['active']:
+                if self.id in payload['lines']:
+                    return dict(payload['lines'][self.id])
+                return self._convert_l10n_ar_prices_to_pesos(super()._l10n_ar_prices_and_taxes())
+        return super()._l10n_ar_prices_and_taxes()
+
+    def _convert_l10n_ar_prices_to_pesos(self, prices):
+        """Convierte a pesos las claves monetarias del dict de _l10n_ar_prices_and_taxes()."""
         move = self.move_id
-        if move.print_in_pesos and move._is_foreign_currency():
-            # Por qué: Si hay TC manual, lo usamos; sino usamos el TC automático de la fecha
-            if move.manual_currency_rate:
-                # Tip: Convertimos todas las claves monetarias del dict usando TC manual
-                for key in ('price_unit', 'price_subtotal', 'price_total', 'vat_amount'):
-                    if key in result:
-                        result[key] = result[key] * move.manual_currency_rate
-            else:
-                currency = move.currency_id
-                company_currency = move.company_currency_id
-                company = move.company_id
-                date = move.invoice_date or move.date or fields.Date.context_today(self)
-                # Tip: Convertimos todas las claves monetarias del dict usando TC automático
-                for key in ('price_unit', 'price_subtotal', 'price_total', 'vat_amount'):
-                    if key in result:
-                        result[key] = currency._convert(
-                            result[key], company_currency, company, date)
-        return result
+        # Tip: Convertimos todas las claves monetarias del dict (TC manual o automático)
+        for key in ('price_unit', 'price_subtotal', 'price_total', 'vat_amount'):
+            if key in prices:
+                prices[key] = move._convert_amount_to_pesos(prices[key])
+        return prices
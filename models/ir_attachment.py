@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from .pesos_document_mixin import PESOS_MASS_PRINT_DESCRIPTION
+
+# Horas que se conserva un PDF/ZIP de impresión masiva antes de borrarlo
+PESOS_MASS_PRINT_RETENTION_HOURS = 24
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.autovacuum
+    def _gc_pesos_mass_print(self):
+        """Borra los PDF/ZIP de impresión masiva en pesos ya descargados."""
+        # Por qué: Son adjuntos sin documento (res_model vacío) que solo sirven
+        # para la descarga inmediata; sin esto quedarían en el filestore para siempre
+        attachments = self.sudo().search([
+            ('description', '=', PESOS_MASS_PRINT_DESCRIPTION),
+            ('res_model', '=', False),
+            ('create_date', '<', fields.Datetime.now() - timedelta(hours=PESOS_MASS_PRINT_RETENTION_HOURS)),
+        ])
+        attachments.unlink()
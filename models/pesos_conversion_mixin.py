@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+from odoo import fields, models
+
+from .pesos_perf_stat import pesos_perf
+
+
+class PesosConversionMixin(models.AbstractModel):
+    _name = 'pesos.conversion.mixin'
+    _description = 'Conversión a Pesos por Lotes'
+
+    # Por qué: Los seis _compute_amounts_pesos del módulo hacían lo mismo registro
+    # por registro. Centralizamos la conversión para resolver el TC una vez por grupo.
+    # Patrón: Cada modelo solo define de dónde sale su clave de conversión.
+    def _get_pesos_conversion_key(self):
+        """Retorna (moneda, moneda compañía, compañía, fecha, TC manual, TC congelado) del registro."""
+        raise NotImplementedError()
+
+    def _get_pesos_conversion_groups(self):
+        """Agrupa el recordset por clave de conversión normalizada.
+
+        Retorna un dict {(moneda, moneda compañía, compañía, fecha, TC manual, TC congelado): [registros]}.
+        """
+        groups = defaultdict(list)
+        # Tip: Al recorrer el recordset completo el ORM prefetchea en bloque
+        # las monedas, fechas y TC de todos los registros (y de sus documentos padre)
+        for record in self:
+            currency, company_currency, company, date, manual_rate, frozen_rate = record._get_pesos_conversion_key()
+            if not currency or not company_currency or currency == company_currency:
+                # Por qué: En moneda local la fecha y el TC no influyen, un único grupo alcanza
+                key = (currency, company_currency, company, False, 0.0, 0.0)
+            elif manual_rate:
+                # Tip: El TC manual gana al congelado; al editarlo se vuelve a congelar
+                key = (currency, company_currency, company, False, manual_rate, 0.0)
+            elif frozen_rate:
+                key = (currency, company_currency, company, False, 0.0, frozen_rate)
+            else:
+                date = fields.Date.to_date(date) or fields.Date.context_today(record)
+                key = (currency, company_currency, company, date, 0.0, 0.0)
+            groups[key].append(record)
+        return groups
+
+    @pesos_perf('compute_amounts_pesos')
+    def _compute_pesos_amounts_batch(self, field_map):
+        """Asigna los campos en pesos de todo el recordset en una sola pasada.
+
+        field_map: dict {campo en moneda del documento: campo en pesos}.
+        """
+        for (currency, company_currency, company, date, manual_rate, frozen_rate), records in self._get_pesos_conversion_groups().items():
+            if frozen_rate:
+                # Por qué: TC automático congelado: misma tasa de siempre, sin buscarla, y se redondea
+                rate, rounding_currency = frozen_rate, company_currency
+            elif not date:
+                # Por qué: Moneda local (TC 1) o TC manual: multiplicación directa, sin redondeo
+                rate, rounding_currency = manual_rate or 1.0, False
+            else:
+                # Por qué: TC automático, una sola consulta por grupo; se redondea igual que _convert()
+                rate = currency._get_pesos_rate(company_currency, company, date)
+                rounding_currency = company_currency
+            for record in records:
+                for source, target in field_map.items():
+                    amount = record[source] * rate
+                    record[target] = rounding_currency.round(amount) if rounding_currency else amount
+
+    def _pesos_xmlid(self, name):
+        """Retorna el xmlid completo de un registro de datos de este módulo."""
+        # Tip: _module de la clase de definición es el nombre técnico de este módulo
+        return f'{PesosConversionMixin._module}.{name}'
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+import os
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import float_compare
+from odoo.tools.pdf import merge_pdf
+from odoo.tools.sql import column_exists, create_column
+
+# Por qué: Tamaño de lote del cron que registra los resúmenes de TC diferidos
+PESOS_RATE_SUMMARY_BATCH_SIZE = 500
+
+# Por qué: Documentos por render en la impresión masiva en pesos. Cada lote es
+# una llamada a wkhtmltopdf; lotes chicos reparten mejor el trabajo entre workers.
+PESOS_MASS_PRINT_CHUNK_SIZE = 50
+# Marca (description) de los adjuntos temporales de la impresión masiva; ver IrAttachment
+PESOS_MASS_PRINT_DESCRIPTION = 'surtecnica_pesos.mass_print'
+
+
+class PesosDocumentMixin(models.AbstractModel):
+    _name = 'pesos.document.mixin'
+    _inherit = 'pesos.conversion.mixin'
+    _description = 'Documento con Tipo de Cambio Manual'
+
+    # Por qué: Comportamiento compartido por los encabezados (account.move,
+    # sale.order, purchase.order); las líneas solo usan pesos.conversion.mixin.
+
+    # Asunto del mensaje de resumen de TC en el chatter
+    _pesos_rate_summary_subject = "Confirmación con Tipo de Cambio"
+
+    # Acción de reporte (nombre local del módulo) que imprime el documento en pesos
+    _pesos_report_action = None
+
+    # Expresión SQL de la fecha del TC automático (la fecha de _get_pesos_conversion_key)
+    _pesos_rate_date_sql = 'date_order::date'
+
+    # Por qué: La condición "moneda extranjera" se evaluaba con un método por
+    # documento en templates, computes, create/write y confirmación.
+    # store + index: se calcula una vez y también sirve como filtro en búsquedas
+    is_foreign_currency = fields.Boolean(
+        string='En Moneda Extranjera',
+        compute='_compute_is_foreign_currency',
+        store=True,
+        index=True,
+    )
+
+    # Por qué: TC congelado al validar/confirmar. Un documento validado no cambia
+    # su TC, así que los montos en pesos se calculan con este valor fijo, sin
+    # buscar tasas, y los reportes SQL lo leen directamente.
+    pesos_frozen_rate = fields.Float(
+        string='TC Congelado',
+        digits=(12, 6),
+        copy=False,
+        readonly=True,
+    )
+    pesos_rate_source = fields.Selection(
+        [('company', 'Moneda de la Compañía'), ('manual', 'Manual'), ('auto', 'Automático')],
+        string='Origen del TC',
+        copy=False,
+        readonly=True,
+    )
+
+    # Por qué: Marca los documentos cuyo resumen de TC quedó encolado para el cron
+    # Tip: btree_not_null deja fuera del índice los documentos que nunca se encolaron
+    pesos_rate_summary_pending = fields.Boolean(
+        string='Resumen de TC Pendiente',
+        copy=False,
+        index='btree_not_null',
+    )
+
+    # Tip: currency_id y company_currency_id los define cada modelo concreto, no el mixin
+    @api.depends(lambda self: () if self._abstract else ('currency_id', 'company_currency_id'))
+    def _compute_is_foreign_currency(self):
+        for record in self:
+            record.is_foreign_currency = bool(
+                record.currency_id and record.company_currency_id
+                and record.currency_id != record.company_currency_id
+            )
+
+    def _auto_init(self):
+        # Por qué: En tablas grandes la columna se completa con un UPDATE en lugar
+        # del recálculo ORM registro por registro al instalar/actualizar el módulo
+        if self._auto and not column_exists(self.env.cr, self._table, 'is_foreign_currency'):
+            create_column(self.env.cr, self._table, 'is_foreign_currency', 'boolean')
+            self.env.cr.execute(f"""
+                UPDATE {self._table} doc
+                   SET is_foreign_currency = (doc.currency_id IS NOT NULL AND doc.currency_id != company.currency_id)
+                  FROM res_company company
+                 WHERE company.id = doc.company_id
+            """)
+        return super()._auto_init()
+
+    # ── TC congelado ──────────────────────────────────────────────────────
+    def _freeze_pesos_rate(self):
+        """Congela el TC efectivo y su origen en los documentos (al validar/confirmar)."""
+        groups = {}
+        for (currency, company_currency, company, date, manual_rate, frozen_rate), records in self._get_pesos_conversion_groups().items():
+            if frozen_rate:
+                # Tip: Ya congelado como automático; se conserva el mismo TC
+                values = (frozen_rate, 'auto')
+            elif not date:
+                # Tip: Sin fecha en la clave: moneda local (TC 1) o TC manual
+                values = (manual_rate, 'manual') if manual_rate else (1.0, 'company')
+            else:
+                values = (currency._get_pesos_rate(company_currency, company, date), 'auto')
+            for record in records:
+                groups.setdefault(values, []).append(record.id)
+        # Patrón: Un write por (TC, origen) en lugar de uno por documento
+        for (rate, source), ids in groups.items():
+            self.browse(ids).write({'pesos_frozen_rate': rate, 'pesos_rate_source': source})
+
+    def _check_pesos_rate_editable(self, vals):
+        """Impide cambiar el TC manual de documentos con el TC congelado.
+
+        Por qué: Validado o confirmado, el documento conserva su TC y sus montos en
+        pesos (y la contabilidad ya publicada); para cambiarlo se vuelve a borrador.
+        """
+        if 'manual_currency_rate' not in vals:
+            return
+        new_rate = vals['manual_currency_rate'] or 0.0
+        frozen = self.filtered(lambda record: record.pesos_rate_source and float_compare(
+            record.manual_currency_rate, new_rate, precision_digits=6))
+        if frozen:
+            raise UserError(_(
+                "No se puede modificar el tipo de cambio de documentos validados o confirmados: %s. "
+                "Vuelva el documento a borrador para cambiarlo.",
+                ", ".join(frozen.mapped('display_name'))))
+
+    def _unfreeze_pesos_rate(self):
+        """Descongela el TC al volver el documento a borrador."""
+        frozen = self.filtered('pesos_frozen_rate')
+        if frozen:
+            frozen.write({'pesos_frozen_rate': 0.0, 'pesos_rate_source': False})
+
+    # ── Recálculo por corrección de TC ────────────────────────────────────
+    # Por qué: Al corregir una tasa histórica solo cambian los documentos cuyo
+    # TC automático sale de los días corregidos; pesos.rate.correction los
+    # recorre por lotes con estos dos métodos.
+    def _get_pesos_rate_dependent_where(self):
+        """Condición SQL extra de los documentos con montos en pesos persistidos."""
+        # Tip: Las órdenes calculan los pesos al leer; solo persiste el TC congelado
+        return "pesos_rate_source = 'auto'"
+
+    @api.model
+    def _get_pesos_rate_dependent_ids(self, correction, last_id, limit):
+        """Retorna los siguientes ids (> last_id) que dependen del tramo corregido."""
+        self.env.cr.execute(f"""
+            SELECT id
+              FROM {self._table}
+             WHERE id > %s
+               AND company_id = %s
+               AND currency_id = %s
+               AND {self._pesos_rate_date_sql} BETWEEN %s AND %s
+               AND COALESCE(manual_currency_rate, 0) = 0
+               AND {self._get_pesos_rate_dependent_where()}
+          ORDER BY id
+             LIMIT %s
+        """, [last_id, correction.company_id.id, correction.currency_id.id,
+              correction.date_from, correction.date_to, limit])
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _recompute_pesos_rate(self):
+        """Vuelve a congelar con el TC corregido los documentos de origen automático."""
+        frozen = self.filtered(lambda record: record.pesos_rate_source == 'auto')
+        if frozen:
+            # Tip: Sin el TC congelado, la clave de conversión vuelve a buscar la tasa
+            frozen.write({'pesos_frozen_rate': 0.0})
+            frozen._freeze_pesos_rate()
+
+    # ── Impresión en pesos ────────────────────────────────────────────────
+    # Por qué: La impresión en pesos se decide por documento (print_in_pesos) o
+    # solo para un render con la clave de contexto print_in_pesos, sin escribir.
+    def _is_pesos_print(self):
+        """Retorna True si el documento se imprime en pesos en este contexto."""
+        self.ensure_one()
+        print_in_pesos = self.env.context.get('print_in_pesos')
+        if print_in_pesos is None:
+            print_in_pesos = self.print_in_pesos
+        return bool(print_in_pesos) and self.is_foreign_currency
+
+    def action_print_pesos(self):
+        """Smart button: imprime el documento en pesos sin escribir print_in_pesos."""
+        return self.env.ref(self._pesos_xmlid(self._pesos_report_action)).report_action(self)
+
+    def action_print_pesos_mass(self, output='pdf'):
+        """Imprime el recordset en pesos y descarga un único PDF o un ZIP (output='zip').
+
+        Por qué: Al cierre de mes se imprimen cientos de documentos en pesos. Los
+        renders se hacen por lotes en paralelo y el modo pesos se pasa por contexto,
+        sin tocar print_in_pesos de cada documento.
+        """
+        if not self:
+            return False
+        pdfs = self._render_pesos_pdfs()
+        if output == 'zip':
+            content, name, mimetype = self._pack_pesos_pdfs_zip(pdfs), 'pesos.zip', 'application/zip'
+        else:
+            content, name, mimetype = merge_pdf([pdf for __, pdf in pdfs]), 'pesos.pdf', 'application/pdf'
+        # Tip: Sin res_model el adjunto solo lo puede leer quien lo creó; es
+        # temporal y lo borra el autovacuum (IrAttachment._gc_pesos_mass_print)
+        attachment = self.env['ir.attachment'].create({
+            'name': name,
+            'datas': base64.b64encode(content),
+            'mimetype': mimetype,
+            'description': PESOS_MASS_PRINT_DESCRIPTION,
+        })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    def _render_pesos_pdfs(self):
+        """Renderiza el recordset en pesos por lotes y retorna [(registro o False, pdf)].
+
+        Por qué: El costo está en wkhtmltopdf (un proceso externo por lote), así que
+        varios hilos, cada uno con su cursor, aprovechan todos los núcleos.
+        Patrón: Hilos y no procesos: cada hilo usa el registry ya cargado.
+        """
+        report = self.env.ref(self._pesos_xmlid(self._pesos_report_action))
+        chunks = [self.ids[index:index + PESOS_MASS_PRINT_CHUNK_SIZE]
+                  for index in range(0, len(self.ids), PESOS_MASS_PRINT_CHUNK_SIZE)]
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'surtecnica_pesos.mass_print_workers', 0)) or min(4, os.cpu_count() or 1)
+
+        # Por qué: Los cursores de los hilos no ven lo escrito y no confirmado en
+        # esta transacción; si hubo escrituras (o en modo test, donde los cursores
+        # comparten conexión, o con un solo lote/worker) renderizamos en el cursor actual
+        self.env.flush_all()
+        if workers == 1 or len(chunks) == 1 or self.env.registry.in_test_mode() or self._has_pending_writes():
+            results = [self._render_pesos_pdf_chunk(self.env, report.id, chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                results = list(executor.map(self._render_pesos_pdf_chunk_new_cursor, [report.id] * len(chunks), chunks))
+
+        pdfs = []
+        for streams in results:
+            for res_id, pdf in streams:
+                pdfs.append((self.browse(res_id) if res_id else False, pdf))
+        return pdfs
+
+    def _has_pending_writes(self):
+        """Retorna True si la transacción actual ya escribió en la base (sin confirmar)."""
+        # Tip: Postgres asigna un id de transacción recién con la primera escritura
+        self.env.cr.execute("SELECT txid_current_if_assigned()")
+        return self.env.cr.fetchone()[0] is not None
+
+    def _render_pesos_pdf_chunk_new_cursor(self, report_id, res_ids):
+        """Renderiza un lote en un cursor propio (se ejecuta en un hilo del pool)."""
+        with self.env.registry.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            return self._render_pesos_pdf_chunk(env, report_id, res_ids)
+
+    @api.model
+    def _render_pesos_pdf_chunk(self, env, report_id, res_ids):
+        """Renderiza un lote en pesos y retorna [(id o False, pdf)] en el orden de res_ids."""
+        report = env['ir.actions.report'].browse(report_id).with_context(print_in_pesos=True)
+        # Tip: _render_qweb_pdf_prepare_streams separa el PDF por documento cuando puede;
+        # si no, devuelve el lote entero bajo la clave False
+        streams = report._render_qweb_pdf_prepare_streams(report.report_name, {}, res_ids=res_ids)
+        result = []
+        for res_id in [*res_ids, False]:
+            if res_id in streams:
+                stream = streams[res_id]['stream']
+                result.append((res_id, stream.getvalue()))
+                stream.close()
+        return result
+
+    def _pack_pesos_pdfs_zip(self, pdfs):
+        """Empaqueta [(registro o False, pdf)] en un ZIP, un archivo por documento."""
+        buffer = io.BytesIO()
+        used_names = set()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for index, (record, pdf) in enumerate(pdfs, start=1):
+                base_name = (record.name or str(record.id)).replace('/', '_') if record else f'lote_{index}'
+                name, suffix = f'{base_name}.pdf', 1
+                while name in used_names:
+                    suffix += 1
+                    name = f'{base_name}_{suffix}.pdf'
+                used_names.add(name)
+                archive.writestr(name, pdf)
+        return buffer.getvalue()
+
+    # ── Propagación del TC a facturas borrador ────────────────────────────
+    # Por qué: Al corregir el TC de una orden con muchas facturas borrador, cada
+    # factura se editaba a mano y cada edición rebalanceaba sus líneas.
+    # Patrón: Un write por TC distinto y un único rebalanceo de todas las facturas
+    # al cerrar el scope de TC manual; un solo mensaje por orden en el chatter.
+    # Tip: Solo para órdenes (sale.order, purchase.order), que tienen invoice_ids
+    def _get_pesos_draft_invoices(self):
+        """Retorna las facturas borrador de la orden en su misma moneda."""
+        self.ensure_one()
+        return self.invoice_ids.filtered(lambda m: m.state == 'draft' and m.currency_id == self.currency_id)
+
+    def action_propagate_rate_to_invoices(self):
+        """Aplica el TC manual de las órdenes a todas sus facturas borrador en lote."""
+        moves_by_rate = defaultdict(lambda: self.env['account.move'])
+        updated = {}
+        seen = self.env['account.move']
+        for order in self.filtered(lambda o: o.manual_currency_rate and o.is_foreign_currency):
+            invoices = order._get_pesos_draft_invoices().filtered(
+                lambda m: m.manual_currency_rate != order.manual_currency_rate) - seen
+            if invoices:
+                seen |= invoices
+                moves_by_rate[order.manual_currency_rate] |= invoices
+                updated[order] = invoices
+        if not updated:
+            return False
+
+        moves = self.env['account.move']
+        # Tip: mail_notrack evita un mensaje de seguimiento por factura; el resumen va en la orden
+        with moves._manual_currency_rate_scope():
+            for rate, invoices in moves_by_rate.items():
+                invoices.with_context(mail_notrack=True).write({'manual_currency_rate': rate})
+
+        bodies = {
+            order.id: f"Tipo de Cambio {order.manual_currency_rate:.4f} aplicado a "
+                      f"{len(invoices)} factura(s) borrador: {', '.join(invoices.mapped('display_name'))}"
+            for order, invoices in updated.items()
+        }
+        self.browse(list(bodies))._message_log_batch(bodies=bodies, subject="Propagación de Tipo de Cambio")
+        return True
+
+    # ── Chatter ───────────────────────────────────────────────────────────
+    def _log_currency_rate_change(self, old_rates, new_rate):
+        """Registra en el chatter el cambio de TC de cada documento.
+
+        old_rates: dict {id: TC anterior}. Solo se registra si el nuevo TC está definido.
+        """
+        if not new_rate:
+            return
+        modified = {
+            record_id: f"Tipo de Cambio modificado: {old_rate:.4f} → {new_rate:.4f}"
+            for record_id, old_rate in old_rates.items() if old_rate
+        }
+        established = {
+            record_id: f"Tipo de Cambio establecido: {new_rate:.4f}"
+            for record_id, old_rate in old_rates.items() if not old_rate
+        }
+        # Patrón: _message_log_batch crea todos los mensajes con un solo create,
+        # sin seguidores ni notificaciones por registro como message_post
+        if modified:
+            self.browse(list(modified))._message_log_batch(bodies=modified, subject="Cambio de Tipo de Cambio")
+        if established:
+            self.browse(list(established))._message_log_batch(bodies=established, subject="Tipo de Cambio")
+
+    def _get_rate_summary_values(self):
+        """Retorna los valores del template de resumen de TC del documento."""
+        raise NotImplementedError()
+
+    def _get_rate_summary_common_values(self, date):
+        """Valores del resumen de TC compartidos por todos los documentos."""
+        self.ensure_one()
+        total_pesos = self.amount_total * self.manual_currency_rate
+        return {
+            'rate': f"{self.manual_currency_rate:.4f}",
+            'currency_name': self.currency_id.name,
+            'company_currency_name': self.company_currency_id.name,
+            'date': date.strftime('%d/%m/%Y') if date else 'N/A',
+            'currency_symbol': self.currency_id.symbol,
+            'amount_total': f"{self.amount_total:,.2f}",
+            'company_currency_symbol': self.company_currency_id.symbol,
+            'total_pesos': f"{total_pesos:,.2f}",
+        }
+
+    def _log_rate_summary(self):
+        """Registra el resumen de TC en el chatter de los documentos en moneda extranjera.
+
+        Por qué: Con el contexto pesos_defer_rate_summary o el parámetro
+        surtecnica_pesos.defer_rate_summary, el registro se encola para un cron
+        en lugar de hacerse dentro de la confirmación.
+        """
+        records = self.filtered(lambda r: r.manual_currency_rate and r.is_foreign_currency)
+        if not records:
+            return
+        defer = self.env.context.get('pesos_defer_rate_summary')
+        if defer is None:
+            # Tip: Mismo criterio que surtecnica_pesos.perf_stats: '0' y 'False' desactivan
+            defer = self.env['ir.config_parameter'].sudo().get_param('surtecnica_pesos.defer_rate_summary', '0')
+            defer = defer not in ('', '0', 'False', 'false')
+        if defer:
+            records.write({'pesos_rate_summary_pending': True})
+            self.env.ref(self._pesos_xmlid('ir_cron_post_rate_summaries'))._trigger()
+            return
+        records._post_rate_summary()
+
+    def _post_rate_summary(self):
+        """Crea los mensajes de resumen de TC de todo el recordset con un solo create."""
+        # Patrón: Un único template QWeb (compilado y cacheado por ir.qweb) en lugar
+        # de armar HTML con f-strings, y _message_log_batch en lugar de un
+        # message_post por documento (sin seguidores ni notificaciones por registro)
+        template = self._pesos_xmlid('message_currency_rate_summary')
+        qweb = self.env['ir.qweb']
+        bodies = {
+            record.id: qweb._render(template, record._get_rate_summary_values())
+            for record in self
+        }
+        self._message_log_batch(bodies=bodies, subject=self._pesos_rate_summary_subject)
+
+    @api.model
+    def _cron_post_rate_summaries(self, batch_size=PESOS_RATE_SUMMARY_BATCH_SIZE):
+        """Cron: registra los resúmenes de TC encolados, por lotes."""
+        for model_name in ('account.move', 'sale.order', 'purchase.order'):
+            model = self.env[model_name]
+            while True:
+                records = model.search([('pesos_rate_summary_pending', '=', True)], limit=batch_size)
+                if not records:
+                    break
+                records._post_rate_summary()
+                records.write({'pesos_rate_summary_pending': False})
+                self.env.cr.commit()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import os
+import tempfile
+import time
+
+import xlsxwriter
+
+from odoo import _, api, fields, models
+from odoo.exceptions import AccessError, UserError
+
+_logger = logging.getLogger(__name__)
+
+# Filas por lote leído de Postgres; la memoria del export depende de este número
+PESOS_EXPORT_BATCH_SIZE = 5000
+# Tip: Límite de filas de una hoja XLSX (encabezado incluido); al superarlo se abre otra hoja
+PESOS_EXPORT_XLSX_MAX_ROWS = 1048576
+
+# Por qué: Cada análisis de líneas es una vista SQL; para exportarlo solo hace
+# falta saber la tabla del documento, su campo y las columnas de fecha y cantidad.
+# Clave: (modelo de reporte, tabla del documento, campo documento, fecha, cantidad)
+PESOS_EXPORT_SOURCES = {
+    'purchase': ('purchase.line.pesos.report', 'purchase_order', 'order_id', 'date_order', 'product_qty'),
+    'sale': ('sale.line.pesos.report', 'sale_order', 'order_id', 'date_order', 'product_uom_qty'),
+    'invoice': ('account.invoice.line.pesos.report', 'account_move', 'move_id', 'invoice_date', 'quantity'),
+}
+
+
+class PesosLineExport(models.Model):
+    _name = 'pesos.line.export'
+    _description = 'Exportación de Líneas en Pesos'
+    _order = 'id desc'
+
+    # Por qué: El export genérico de la lista carga todos los registros y sus
+    # campos computados en memoria; con cientos de miles de líneas el worker
+    # supera el límite. Este export lee la vista SQL del análisis por lotes
+    # (paginación por id) y escribe cada lote al archivo antes de leer el
+    # siguiente, en un cron en segundo plano que deja el resultado adjunto.
+
+    name = fields.Char(string='Nombre', compute='_compute_name', store=True)
+    report_type = fields.Selection([
+        ('purchase', 'Líneas de Compra'),
+        ('sale', 'Líneas de Venta'),
+        ('invoice', 'Líneas de Factura'),
+    ], string='Análisis', required=True, default='purchase')
+    date_from = fields.Date(string='Desde')
+    date_to = fields.Date(string='Hasta')
+    file_format = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'XLSX'),
+    ], string='Formato', required=True, default='xlsx')
+    company_ids = fields.Many2many(
+        'res.company',
+        string='Compañías',
+        required=True,
+        default=lambda self: self.env.companies,
+    )
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('queued', 'En Cola'),
+        ('done', 'Terminado'),
+        ('failed', 'Error'),
+    ], string='Estado', default='draft', required=True, readonly=True, copy=False)
+    row_count = fields.Integer(string='Filas', readonly=True, copy=False)
+    duration = fields.Float(string='Duración (s)', digits=(16, 1), readonly=True, copy=False)
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', readonly=True, copy=False)
+    error = fields.Text(string='Error', readonly=True, copy=False)
+
+    @api.depends('report_type', 'date_from', 'date_to', 'file_format')
+    def _compute_name(self):
+        labels = dict(self._fields['report_type'].selection)
+        for export in self:
+            period = ' - '.join(str(date) for date in (export.date_from, export.date_to) if date)
+            export.name = f"{labels.get(export.report_type, '')} {period}".strip()
+
+    # ── Acciones ──────────────────────────────────────────────────────────
+    def action_queue(self):
+        """Encola la exportación y dispara el cron."""
+        for export in self:
+            # Por qué: El cron corre como superusuario, sin reglas de registro;
+            # validamos acá que el usuario pueda leer el análisis y las compañías
+            export._check_export_access(self.env.user)
+        self.write({'state': 'queued', 'error': False})
+        self.env.ref(self.env['pesos.conversion.mixin']._pesos_xmlid('ir_cron_pesos_line_export'))._trigger()
+
+    def action_download(self):
+        """Descarga el archivo generado."""
+        self.ensure_one()
+        if not self.attachment_id:
+            raise UserError(_("La exportación todavía no generó un archivo."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def _check_export_access(self, user):
+        """Valida que user pueda leer el análisis pedido en todas sus compañías."""
+        self.ensure_one()
+        if not self.company_ids:
+            raise UserError(_("Seleccione al menos una compañía para exportar."))
+        if not self.company_ids <= user.company_ids:
+            raise AccessError(_("No tiene acceso a todas las compañías seleccionadas."))
+        self.env[PESOS_EXPORT_SOURCES[self.report_type][0]].with_user(user).check_access_rights('read')
+
+    # ── Cron ──────────────────────────────────────────────────────────────
+    @api.model
+    def _cron_run_exports(self):
+        """Cron: genera las exportaciones en cola, confirmando cada una."""
+        for export in self.search([('state', '=', 'queued')], order='id'):
+            start = time.monotonic()
+            try:
+                with self.env.cr.savepoint():
+                    # Tip: Se vuelve a validar contra el creador; sus compañías o
+                    # grupos pueden haber cambiado desde que encoló la exportación
+                    export._check_export_access(export.create_uid)
+                    row_count = export._run_export()
+            except Exception as e:
+                _logger.exception("Pesos export %s failed", export.id)
+                export.write({'state': 'failed', 'error': str(e)})
+            else:
+                export.write({
+                    'state': 'done',
+                    'row_count': row_count,
+                    'duration': time.monotonic() - start,
+                })
+                _logger.info("Pesos export %s: %d rows in %.1f s", export.id, row_count, export.duration)
+            self.env.cr.commit()
+
+    def _run_export(self):
+        """Escribe el análisis a un archivo temporal y lo adjunta; retorna las filas."""
+        self.ensure_one()
+        headers = self._get_export_headers()
+        suffix = f'.{self.file_format}'
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='pesos_export_')
+        os.close(fd)
+        try:
+            if self.file_format == 'csv':
+                row_count = self._write_csv(path, headers)
+            else:
+                row_count = self._write_xlsx(path, headers)
+            # Tip: Solo el archivo final pasa por memoria (bytes), nunca los registros
+            with open(path, 'rb') as file:
+                attachment = self.env['ir.attachment'].create({
+                    'name': f"{self.name.replace('/', '_')}{suffix}",
+                    'raw': file.read(),
+                    'res_model': self._name,
+                    'res_id': self.id,
+                })
+        finally:
+            os.unlink(path)
+        self.attachment_id = attachment
+        return row_count
+
+    def _write_csv(self, path, headers):
+        row_count = 0
+        with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            for rows in self._iter_export_batches():
+                writer.writerows(rows)
+                row_count += len(rows)
+        return row_count
+
+    def _write_xlsx(self, path, headers):
+        # Por qué: constant_memory escribe cada fila al disco apenas se completa
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'remove_timezone': True})
+        bold = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        sheet, sheet_row, row_count = None, PESOS_EXPORT_XLSX_MAX_ROWS, 0
+        try:
+            for rows in self._iter_export_batches():
+                for row in rows:
+                    if sheet_row >= PESOS_EXPORT_XLSX_MAX_ROWS:
+                        sheet = workbook.add_worksheet()
+                        sheet.write_row(0, 0, headers, bold)
+                        sheet.set_column(1, 1, 12, date_format)
+                        sheet_row = 1
+                    sheet.write_row(sheet_row, 0, row)
+                    sheet_row += 1
+                row_count += len(rows)
+            if sheet is None:
+                workbook.add_worksheet().write_row(0, 0, headers, bold)
+        finally:
+            workbook.close()
+        return row_count
+
+    # ── Lectura por lotes ─────────────────────────────────────────────────
+    def _get_export_headers(self):
+        return [
+            _("Documento"), _("Fecha"), _("Empresa"), _("Producto"), _("Descripción"),
+            _("Categoría"), _("UdM"), _("Cantidad"), _("Moneda"), _("Precio Unitario"),
+            _("Subtotal"), _("Tipo de Cambio"), _("Moneda de la Compañía"),
+            _("Subtotal (Pesos)"), _("Estado"),
+        ]
+
+    def _get_export_query(self):
+        """Retorna (query, params) de un lote: filas con id mayor a %(last_id)s."""
+        report_model, doc_table, doc_field, date_field, qty_field = PESOS_EXPORT_SOURCES[self.report_type]
+        report = self.env[report_model]
+        conditions = ["r.id > %(last_id)s", "r.company_id IN %(company_ids)s", f"r.id IN {self._get_export_rule_subquery()}"]
+        params = {'lang': self.create_uid.lang or 'en_US', 'company_ids': tuple(self.company_ids.ids)}
+        if self.date_from:
+            conditions.append(f"r.{date_field} >= %(date_from)s")
+            params['date_from'] = self.date_from
+        if self.date_to:
+            # Tip: date_order es Datetime; comparamos contra el día siguiente
+            conditions.append(f"r.{date_field} < %(date_to)s::date + 1")
+            params['date_to'] = self.date_to
+        # Por qué: Los nombres traducibles (jsonb) se resuelven en el idioma del usuario
+        query = f"""
+            SELECT r.id, doc.name, r.{date_field}::date, partner.complete_name,
+                   COALESCE(pt.name->>%(lang)s, pt.name->>'en_US'), r.name,
+                   categ.complete_name, COALESCE(uom.name->>%(lang)s, uom.name->>'en_US'),
+                   r.{qty_field}, cur.name, r.price_unit, r.price_subtotal, r.currency_rate,
+                   company_cur.name, r.price_subtotal_pesos, r.state
+              FROM ({report._table_query}) r
+              JOIN {doc_table} doc ON doc.id = r.{doc_field}
+              LEFT JOIN res_partner partner ON partner.id = r.partner_id
+              LEFT JOIN product_product pp ON pp.id = r.product_id
+              LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+              LEFT JOIN product_category categ ON categ.id = r.product_categ_id
+              LEFT JOIN uom_uom uom ON uom.id = r.product_uom_id
+              LEFT JOIN res_currency cur ON cur.id = r.currency_id
+              LEFT JOIN res_currency company_cur ON company_cur.id = r.company_currency_id
+             WHERE {" AND ".join(conditions)}
+          ORDER BY r.id
+             LIMIT %(limit)s
+        """
+        return query, params
+
+    def _get_export_rule_subquery(self):
+        """Retorna la subconsulta SQL de los ids del análisis que el creador puede leer.
+
+        Por qué: El cron lee la vista con SQL directo como superusuario; sin esto
+        no se aplican las reglas de registro (por ejemplo, el vendedor que solo ve
+        sus documentos exportaría las líneas de toda la compañía).
+        """
+        report = self.env[PESOS_EXPORT_SOURCES[self.report_type][0]].with_user(self.create_uid).with_context(
+            allowed_company_ids=self.company_ids.ids)
+        subquery = self.env.cr.mogrify(report._search([]).subselect()).decode()
+        # Tip: La subconsulta ya trae sus parámetros incrustados; escapamos los % para
+        # que no se confundan con los parámetros del query del export
+        return subquery.replace('%', '%%')
+
+    def _iter_export_batches(self, batch_size=PESOS_EXPORT_BATCH_SIZE):
+        """Genera lotes de filas (sin id) paginando por id; nunca carga más de un lote."""
+        query, params = self._get_export_query()
+        states = dict(self.env[PESOS_EXPORT_SOURCES[self.report_type][0]]._fields['state'].selection)
+        params['limit'] = batch_size
+        last_id = 0
+        while True:
+            self.env.cr.execute(query, dict(params, last_id=last_id))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[1:-1] + (states.get(row[-1], row[-1]),) for row in rows]
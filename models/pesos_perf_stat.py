@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import logging
+import os
+import threading
+import time
+
+from odoo import SUPERUSER_ID, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Por qué: Estadísticas de la transacción actual, en cr.cache
+PESOS_PERF_DATA_KEY = 'surtecnica_pesos.perf_stats'
+# Días que se conservan las estadísticas agregadas
+PESOS_PERF_RETENTION_DAYS = 90
+# Segundos mínimos entre dos escrituras de los agregados de un proceso
+PESOS_PERF_FLUSH_INTERVAL = 60
+
+# Por qué: Escribir al final de cada transacción convertía lecturas (PDF,
+# pivots, impresión de solo lectura) en escrituras y los hilos de un mismo
+# proceso competían por la misma fila. Los agregados viven en memoria del
+# proceso, {(base, fecha, operación): entrada}, y se escriben como mucho una
+# vez por PESOS_PERF_FLUSH_INTERVAL, en un cursor propio y de a un hilo.
+# Tip: Lo acumulado desde la última escritura se pierde si el proceso termina
+_perf_buffer = {}
+_perf_buffer_lock = threading.Lock()
+_perf_flush_lock = threading.Lock()
+_perf_last_flush = {}
+
+
+def _get_perf_stats(env):
+    """Retorna el dict de estadísticas de la transacción, o None si están desactivadas."""
+    cache = env.cr.cache
+    stats = cache.get(PESOS_PERF_DATA_KEY)
+    if stats is None:
+        # Tip: Los parámetros se leen una sola vez por transacción
+        get_param = env['ir.config_parameter'].sudo().get_param
+        enabled = get_param('surtecnica_pesos.perf_stats', '1')
+        stats = cache[PESOS_PERF_DATA_KEY] = {} if enabled not in ('0', 'False', 'false') else False
+        if stats is not False:
+            threshold = float(get_param('surtecnica_pesos.perf_log_threshold_ms', 500))
+            end = functools.partial(_end_perf_transaction, env.cr, env.registry, threshold)
+            env.cr.postcommit.add(end)
+            env.cr.postrollback.add(end)
+    return stats if stats is not False else None
+
+
+def _end_perf_transaction(cr, registry, threshold):
+    """Postcommit/postrollback: suma la transacción al proceso y deja una línea de log."""
+    stats = cr.cache.pop(PESOS_PERF_DATA_KEY, None)
+    if not stats:
+        return
+    date = fields.Date.today()
+    with _perf_buffer_lock:
+        for name, entry in stats.items():
+            total = _get_perf_entry(_perf_buffer, (registry.db_name, date, name))
+            for counter in ('count', 'total_ms', 'hits', 'misses'):
+                total[counter] += entry[counter]
+            total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+
+    # Por qué: Solo dejamos en INFO las transacciones lentas; el resto en DEBUG
+    total_ms = sum(entry['total_ms'] for entry in stats.values())
+    level = logging.INFO if total_ms >= threshold else logging.DEBUG
+    if _logger.isEnabledFor(level):
+        _logger.log(level, "Pesos perf %.1f ms: %s", total_ms, " | ".join(
+            "%s %dx %.1f ms%s" % (
+                name, entry['count'], entry['total_ms'],
+                " (cache %d/%d)" % (entry['hits'], entry['hits'] + entry['misses'])
+                if entry['hits'] + entry['misses'] else "",
+            )
+            for name, entry in sorted(stats.items())
+        ))
+
+    now = time.monotonic()
+    if now - _perf_last_flush.setdefault(registry.db_name, now) < PESOS_PERF_FLUSH_INTERVAL:
+        return
+    # Tip: Si otro hilo ya está escribiendo, este no espera
+    if not _perf_flush_lock.acquire(blocking=False):
+        return
+    try:
+        _perf_last_flush[registry.db_name] = now
+        with registry.cursor() as flush_cr:
+            api.Environment(flush_cr, SUPERUSER_ID, {})['pesos.perf.stat']._flush_perf_stats()
+    except Exception:
+        _logger.warning("Pesos perf: could not persist the aggregated stats", exc_info=True)
+    finally:
+        _perf_flush_lock.release()
+
+
+def _get_perf_entry(stats, name):
+    entry = stats.get(name)
+    if entry is None:
+        entry = stats[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'hits': 0, 'misses': 0}
+    return entry
+
+
+def pesos_perf(name):
+    """Decorador: acumula llamadas y tiempo del método bajo la clave name.
+
+    Por qué: Saber si un PDF o un pivot lento se fue en búsquedas de TC,
+    rebalanceo de líneas o conversión del template. El costo es un
+    perf_counter y un dict por llamada, apto para dejar activo en producción.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = _get_perf_stats(self.env)
+            if stats is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                entry = _get_perf_entry(stats, name)
+                entry['count'] += 1
+                entry['total_ms'] += elapsed
+                entry['max_ms'] = max(entry['max_ms'], elapsed)
+        return wrapper
+    return decorator
+
+
+def pesos_perf_cache(env, name, hit):
+    """Registra un acierto (hit=True) o fallo de cache bajo la clave name."""
+    stats = _get_perf_stats(env)
+    if stats is not None:
+        entry = _get_perf_entry(stats, name)
+        entry['hits' if hit else 'misses'] += 1
+
+
+class PesosPerfStat(models.Model):
+    _name = 'pesos.perf.stat'
+    _description = 'Estadísticas de Rendimiento de Conversión a Pesos'
+    _order = 'date desc, total_ms desc'
+    _log_access = False
+
+    # Por qué: Agregados por día y proceso; cada proceso escribe sus filas de a
+    # un hilo por vez (ver _perf_flush_lock), así el upsert nunca compite
+    name = fields.Char(string='Operación', required=True, readonly=True)
+    date = fields.Date(string='Fecha', required=True, readonly=True)
+    worker = fields.Integer(string='Proceso', readonly=True, group_operator=False)
+    call_count = fields.Integer(string='Llamadas', readonly=True)
+    total_ms = fields.Float(string='Tiempo Total (ms)', digits=(16, 1), readonly=True)
+    max_ms = fields.Float(string='Máximo (ms)', digits=(16, 1), readonly=True, group_operator='max')
+    avg_ms = fields.Float(string='Promedio (ms)', digits=(16, 2), compute='_compute_ratios')
+    cache_hits = fields.Integer(string='Aciertos de Cache', readonly=True)
+    cache_misses = fields.Integer(string='Fallos de Cache', readonly=True)
+    cache_hit_rate = fields.Float(string='Tasa de Aciertos (%)', digits=(16, 1), compute='_compute_ratios')
+
+    _sql_constraints = [
+        ('name_date_worker_uniq', 'unique(name, date, worker)',
+         'Solo puede haber un agregado por operación, fecha y proceso.'),
+    ]
+
+    @api.depends('call_count', 'total_ms', 'cache_hits', 'cache_misses')
+    def _compute_ratios(self):
+        for stat in self:
+            stat.avg_ms = stat.total_ms / stat.call_count if stat.call_count else 0.0
+            lookups = stat.cache_hits + stat.cache_misses
+            stat.cache_hit_rate = 100.0 * stat.cache_hits / lookups if lookups else 0.0
+
+    @api.model
+    def _flush_perf_stats(self):
+        """Escribe y descarta los agregados en memoria del proceso para esta base."""
+        with _perf_buffer_lock:
+            keys = [key for key in _perf_buffer if key[0] == self.env.cr.dbname]
+            entries = {key[1:]: _perf_buffer.pop(key) for key in keys}
+        if not entries:
+            return
+        worker = os.getpid()
+        rows = [
+            (name, date, worker, entry['count'], entry['total_ms'], entry['max_ms'], entry['hits'], entry['misses'])
+            for (date, name), entry in sorted(entries.items())
+        ]
+        self.env.cr.execute(f"""
+            INSERT INTO pesos_perf_stat (name, date, worker, call_count, total_ms, max_ms, cache_hits, cache_misses)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))}
+            ON CONFLICT (name, date, worker) DO UPDATE
+               SET call_count = pesos_perf_stat.call_count + EXCLUDED.call_count,
+                   total_ms = pesos_perf_stat.total_ms + EXCLUDED.total_ms,
+                   max_ms = GREATEST(pesos_perf_stat.max_ms, EXCLUDED.max_ms),
+                   cache_hits = pesos_perf_stat.cache_hits + EXCLUDED.cache_hits,
+                   cache_misses = pesos_perf_stat.cache_misses + EXCLUDED.cache_misses
+        """, [value for row in rows for value in row])
+
+    @api.autovacuum
+    def _gc_perf_stats(self):
+        """Borra los agregados más viejos que PESOS_PERF_RETENTION_DAYS."""
+        self.env.cr.execute(
+            "DELETE FROM pesos_perf_stat WHERE date < CURRENT_DATE - %s",
+            [PESOS_PERF_RETENTION_DAYS],
+        )
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from odoo import api, fields, models
+
+from .account_move import PESOS_BACKFILL_TIME_LIMIT
+
+_logger = logging.getLogger(__name__)
+
+# Documentos por lote; cada lote se recalcula y se confirma por separado
+PESOS_CORRECTION_BATCH_SIZE = 500
+# Días que se conservan las correcciones terminadas
+PESOS_CORRECTION_RETENTION_DAYS = 30
+# Tip: Orden en que se recorren los documentos de cada corrección
+PESOS_CORRECTION_STAGES = ('account.move', 'sale.order', 'purchase.order')
+
+
+class PesosRateCorrection(models.Model):
+    _name = 'pesos.rate.correction'
+    _description = 'Recálculo por Corrección de Tipo de Cambio'
+    _order = 'id'
+
+    # Por qué: Corregir una tasa histórica dejaba montos en pesos desactualizados
+    # en los documentos que la usaron. La tabla diaria de TC detecta qué días
+    # cambiaron (compañía, moneda, tramo de fechas); cada tramo queda acá como
+    # índice de dependencias y el cron recalcula solo esos documentos, por lotes
+    # y guardando el avance (etapa y último id), así puede cortarse y retomarse.
+    # Tip: Los documentos con TC manual o congelado como manual no dependen de la tasa
+
+    company_id = fields.Many2one('res.company', required=True, ondelete='cascade', readonly=True)
+    currency_id = fields.Many2one('res.currency', required=True, ondelete='cascade', readonly=True)
+    date_from = fields.Date(string='Desde', required=True, readonly=True)
+    date_to = fields.Date(string='Hasta', required=True, readonly=True)
+    stage = fields.Selection([
+        ('account.move', 'Facturas'),
+        ('sale.order', 'Ventas'),
+        ('purchase.order', 'Compras'),
+        ('done', 'Terminado'),
+    ], string='Etapa', default=PESOS_CORRECTION_STAGES[0], required=True, readonly=True, index=True)
+    last_id = fields.Integer(string='Último Id Procesado', readonly=True)
+    document_count = fields.Integer(string='Documentos Recalculados', readonly=True)
+
+    @api.model
+    def _queue(self, ranges):
+        """Encola [(compañía, moneda, desde, hasta)] y dispara el cron."""
+        self.create([
+            {'company_id': company_id, 'currency_id': currency_id, 'date_from': date_from, 'date_to': date_to}
+            for company_id, currency_id, date_from, date_to in ranges
+        ])
+        self.env.ref(self.env['pesos.conversion.mixin']._pesos_xmlid('ir_cron_pesos_rate_correction'))._trigger()
+
+    @api.model
+    def _cron_process_corrections(self, batch_size=PESOS_CORRECTION_BATCH_SIZE, time_limit=PESOS_BACKFILL_TIME_LIMIT):
+        """Cron: recalcula por lotes los documentos de las correcciones pendientes."""
+        deadline = time.monotonic() + time_limit
+        for correction in self.search([('stage', '!=', 'done')]):
+            while correction.stage != 'done':
+                correction._process_batch(batch_size)
+                self.env.cr.commit()
+                if time.monotonic() > deadline:
+                    # Tip: Quedan lotes pendientes, re-encolamos el cron para seguir enseguida
+                    self.env.ref(self.env['pesos.conversion.mixin']._pesos_xmlid('ir_cron_pesos_rate_correction'))._trigger()
+                    return
+            _logger.info(
+                "Pesos rate correction %s (%s %s..%s): %d documents recomputed",
+                correction.id, correction.currency_id.name, correction.date_from,
+                correction.date_to, correction.document_count,
+            )
+
+    def _process_batch(self, batch_size):
+        """Recalcula el siguiente lote de la etapa actual o pasa a la siguiente etapa."""
+        self.ensure_one()
+        documents = self.env[self.stage].with_company(self.company_id)
+        ids = documents._get_pesos_rate_dependent_ids(self, self.last_id, batch_size)
+        if not ids:
+            stages = PESOS_CORRECTION_STAGES + ('done',)
+            self.write({'stage': stages[stages.index(self.stage) + 1], 'last_id': 0})
+            return
+        documents.browse(ids)._recompute_pesos_rate()
+        self.env.flush_all()
+        self.write({'last_id': ids[-1], 'document_count': self.document_count + len(ids)})
+        # Por qué: Cada lote libera la cache del ORM; la memoria no crece con el tramo
+        self.env.invalidate_all()
+
+    @api.autovacuum
+    def _gc_done_corrections(self):
+        """Borra las correcciones terminadas hace más de PESOS_CORRECTION_RETENTION_DAYS."""
+        self.env.cr.execute(
+            "DELETE FROM pesos_rate_correction WHERE stage = 'done' AND write_date < NOW() - %s * INTERVAL '1 day'",
+            [PESOS_CORRECTION_RETENTION_DAYS],
+        )
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import functools
+from datetime import date as datetime_date
+
+from odoo import api, fields, models
+from odoo.tools.lru import LRU
+
+# Por qué: Meses de TC precargados, compartidos entre requests del worker.
+# Clave: (base, versión, compañía, moneda, año, mes); una versión nueva deja
+# las claves viejas sin uso y el LRU las descarta.
+PESOS_RATE_WINDOW_CACHE = LRU(1024)
+# Por qué: Tabla de una fila que versiona la tabla diaria. Al ser una fila (y no
+# una secuencia) se lee en el mismo snapshot MVCC que las tasas: la versión
+# leída siempre corresponde a las filas que ve la transacción.
+PESOS_RATE_SNAPSHOT_VERSION_TABLE = 'pesos_rate_snapshot_version'
+# Clave en cr.cache: versión leída en la transacción, o None si la transacción
+# recalculó la tabla (sus meses no se comparten hasta confirmar)
+PESOS_RATE_VERSION_KEY = 'surtecnica_pesos_rate_snapshot_version'
+
+
+class PesosRateSnapshot(models.Model):
+    _name = 'pesos.rate.snapshot'
+    _description = 'Tipo de Cambio Diario (Snapshot)'
+    _log_access = False
+
+    # Por qué: Cada conversión sin TC manual buscaba "la última tasa <= fecha" en
+    # res.currency.rate, fila por fila en los reportes SQL de varios años.
+    # Patrón: Tabla diaria (compañía, moneda, fecha) con la tasa vigente ese día,
+    # mantenida desde res.currency.rate; la búsqueda es por índice único, O(1).
+    # Tip: rate tiene la misma semántica que res.currency.rate.rate (unidades por moneda base)
+
+    company_id = fields.Many2one('res.company', required=True, ondelete='cascade')
+    currency_id = fields.Many2one('res.currency', required=True, ondelete='cascade')
+    date = fields.Date(required=True)
+    rate = fields.Float(digits=0, required=True)
+
+    _sql_constraints = [
+        ('company_currency_date_uniq', 'unique(company_id, currency_id, date)',
+         'Solo puede haber un tipo de cambio por compañía, moneda y fecha.'),
+    ]
+
+    def init(self):
+        # Tip: Versiones anteriores usaban una secuencia con el mismo nombre
+        self.env.cr.execute(
+            "SELECT 1 FROM pg_class WHERE relname = %s AND relkind = 'S'", [PESOS_RATE_SNAPSHOT_VERSION_TABLE])
+        if self.env.cr.fetchone():
+            self.env.cr.execute(f"DROP SEQUENCE {PESOS_RATE_SNAPSHOT_VERSION_TABLE}")
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {PESOS_RATE_SNAPSHOT_VERSION_TABLE} (
+                id integer PRIMARY KEY CHECK (id = 1),
+                version integer NOT NULL
+            );
+            INSERT INTO {PESOS_RATE_SNAPSHOT_VERSION_TABLE} (id, version) VALUES (1, 0)
+            ON CONFLICT (id) DO NOTHING
+        """)
+        # Por qué: Reconstruye la tabla completa al instalar/actualizar el módulo
+        self._refresh_snapshot()
+
+    @api.model
+    def _refresh_snapshot(self, currency_ids=None, date_from=None, track_changes=False):
+        """Recalcula los días desde date_from (o todos) de las monedas dadas (o todas).
+
+        Por qué: Una tasa nueva o corregida cambia la tasa vigente de todos los días
+        siguientes hasta la próxima tasa; recalculamos ese tramo por SQL.
+        Con track_changes, los días cuya tasa cambió se encolan en
+        pesos.rate.correction para recalcular los documentos que dependen de ellos.
+        """
+        self.env['res.currency.rate'].flush_model()
+        params = {
+            'currency_ids': tuple(currency_ids or ()),
+            'date_from': date_from,
+            'today': fields.Date.context_today(self),
+        }
+        currency_filter = "AND currency_id IN %(currency_ids)s" if currency_ids else ""
+        date_filter = "AND date >= %(date_from)s" if date_from else ""
+        if track_changes:
+            # Tip: Copia del tramo antes de recalcularlo, para comparar al final
+            self.env.cr.execute(f"""
+                DROP TABLE IF EXISTS pesos_rate_snapshot_old;
+                CREATE TEMP TABLE pesos_rate_snapshot_old ON COMMIT DROP AS
+                SELECT company_id, currency_id, date, rate
+                  FROM pesos_rate_snapshot
+                 WHERE TRUE {currency_filter} {date_filter}
+            """, params)
+        self.env.cr.execute(f"""
+            DELETE FROM pesos_rate_snapshot
+             WHERE TRUE {currency_filter} {date_filter}
+        """, params)
+        # Tip: Cada moneda se cubre desde su primera tasa hasta hoy (o su última
+        # tasa futura); antes de esa fecha la búsqueda cae al TC por defecto
+        # Por qué: La moneda de la compañía (ARS) no suele tener tasas; sin filas
+        # propias toda conversión a pesos caía a la búsqueda nativa. Se guarda
+        # con TC 1.0 en el mismo rango de fechas que el resto de las monedas.
+        self.env.cr.execute(f"""
+            INSERT INTO pesos_rate_snapshot (company_id, currency_id, date, rate)
+            SELECT company.id, cur.currency_id, day::date,
+                   COALESCE((
+                       SELECT r.rate
+                         FROM res_currency_rate r
+                        WHERE r.currency_id = cur.currency_id
+                          AND r.name <= day::date
+                          AND (r.company_id IS NULL OR r.company_id = company.id)
+                     ORDER BY r.company_id, r.name DESC
+                        LIMIT 1
+                   ), 1.0)
+              FROM res_company company
+             CROSS JOIN (
+                    SELECT currency_id, MIN(name) AS first_date, MAX(name) AS last_date
+                      FROM res_currency_rate
+                     WHERE TRUE {currency_filter}
+                  GROUP BY currency_id
+                 UNION ALL
+                    SELECT DISTINCT company_currency.currency_id, bounds.first_date, bounds.last_date
+                      FROM res_company company_currency
+                     CROSS JOIN (
+                            SELECT MIN(name) AS first_date, MAX(name) AS last_date FROM res_currency_rate
+                           ) bounds
+                     WHERE bounds.first_date IS NOT NULL
+                       AND NOT EXISTS (
+                            SELECT 1 FROM res_currency_rate r WHERE r.currency_id = company_currency.currency_id
+                           )
+                       {currency_filter}
+                   ) cur
+             CROSS JOIN LATERAL generate_series(
+                    GREATEST(cur.first_date, COALESCE(%(date_from)s, cur.first_date)),
+                    GREATEST(cur.last_date, %(today)s),
+                    interval '1 day'
+                   ) day
+            ON CONFLICT (company_id, currency_id, date) DO UPDATE SET rate = EXCLUDED.rate
+        """, params)
+        self._clear_rate_windows()
+        if track_changes:
+            self._queue_rate_corrections(currency_filter, date_filter, params)
+
+    @api.model
+    def _queue_rate_corrections(self, currency_filter, date_filter, params):
+        """Encola los tramos de días consecutivos cuya tasa cambió con el refresh."""
+        # Patrón: "Gaps and islands": fecha - número de fila es constante dentro
+        # de cada tramo consecutivo, así un GROUP BY devuelve un rango por tramo
+        self.env.cr.execute(f"""
+            SELECT company_id, currency_id, MIN(date), MAX(date)
+              FROM (
+                    SELECT company_id, currency_id, date,
+                           date - (ROW_NUMBER() OVER (PARTITION BY company_id, currency_id ORDER BY date))::int AS island
+                      FROM (
+                            SELECT * FROM pesos_rate_snapshot WHERE TRUE {currency_filter} {date_filter}
+                           ) new
+                      FULL JOIN pesos_rate_snapshot_old old USING (company_id, currency_id, date)
+                     WHERE new.rate IS DISTINCT FROM old.rate
+                   ) changed
+          GROUP BY company_id, currency_id, island
+        """, params)
+        ranges = self.env.cr.fetchall()
+        self.env.cr.execute("DROP TABLE pesos_rate_snapshot_old")
+        if ranges:
+            self.env['pesos.rate.correction']._queue(ranges)
+
+    @api.model
+    def _clear_rate_windows(self):
+        """Descarta los TC cacheados de la transacción y versiona la tabla.
+
+        Por qué: registry.clear_cache() vaciaba el ormcache completo de todos los
+        workers. Ahora solo cambia la versión de los meses precargados, en la
+        misma transacción que las filas: las transacciones que no ven el refresh
+        tampoco ven la versión nueva y sus meses quedan bajo la versión vieja.
+        Hasta el commit esta transacción lee sin cache compartido (no publica
+        filas que podrían revertirse).
+        """
+        self.env['res.currency']._clear_pesos_rate_cache()
+        self.env.cr.execute(
+            f"UPDATE {PESOS_RATE_SNAPSHOT_VERSION_TABLE} SET version = version + 1 WHERE id = 1")
+        self._set_snapshot_version(None)
+
+    @api.model
+    def _cron_extend_snapshot(self):
+        """Cron: agrega los días transcurridos desde la última fecha de la tabla."""
+        self.env.cr.execute("SELECT MAX(date) FROM pesos_rate_snapshot")
+        last_date = self.env.cr.fetchone()[0]
+        self._refresh_snapshot(date_from=last_date)
+
+    @api.model
+    def _get_rates(self, currencies, company, date):
+        """Retorna {id moneda: tasa} de la tabla para la fecha; faltan las monedas sin fila."""
+        rates = {}
+        for currency_id in currencies.ids:
+            rate = self._get_rate_window(company.id, currency_id, date.year, date.month).get(date)
+            if rate is not None:
+                rates[currency_id] = rate
+        return rates
+
+    # Por qué: Los onchange de TC de los formularios piden una fecha por request;
+    # precargamos el mes completo una vez por worker y las fechas vecinas no
+    # vuelven a consultar la base. Se invalida al versionar la tabla.
+    @api.model
+    def _get_rate_window(self, company_id, currency_id, year, month):
+        """Retorna {fecha: tasa} del mes indicado (no mutar: está cacheado)."""
+        version = self._get_snapshot_version()
+        if version is None:
+            return self._read_rate_window(company_id, currency_id, year, month)
+        key = (self.env.cr.dbname, version, company_id, currency_id, year, month)
+        window = PESOS_RATE_WINDOW_CACHE.get(key)
+        if window is None:
+            window = PESOS_RATE_WINDOW_CACHE[key] = self._read_rate_window(company_id, currency_id, year, month)
+        return window
+
+    @api.model
+    def _get_snapshot_version(self):
+        """Retorna la versión de la tabla (una consulta por transacción) o None si cambió en ella."""
+        cache = self.env.cr.cache
+        if PESOS_RATE_VERSION_KEY not in cache:
+            self.env.cr.execute(f"SELECT version FROM {PESOS_RATE_SNAPSHOT_VERSION_TABLE} WHERE id = 1")
+            row = self.env.cr.fetchone()
+            self._set_snapshot_version(row[0] if row else None)
+        return cache[PESOS_RATE_VERSION_KEY]
+
+    @api.model
+    def _set_snapshot_version(self, version):
+        cache = self.env.cr.cache
+        if PESOS_RATE_VERSION_KEY not in cache:
+            # Tip: cr.cache sobrevive al commit; la versión vale solo para esta transacción
+            forget = functools.partial(cache.pop, PESOS_RATE_VERSION_KEY, None)
+            self.env.cr.postcommit.add(forget)
+            self.env.cr.postrollback.add(forget)
+        cache[PESOS_RATE_VERSION_KEY] = version
+
+    @api.model
+    def _read_rate_window(self, company_id, currency_id, year, month):
+        date_from = datetime_date(year, month, 1)
+        date_to = datetime_date(year, month, calendar.monthrange(year, month)[1])
+        self.env.cr.execute("""
+            SELECT date, rate
+              FROM pesos_rate_snapshot
+             WHERE company_id = %s AND currency_id = %s AND date BETWEEN %s AND %s
+        """, [company_id, currency_id, date_from, date_to])
+        return dict(self.env.cr.fetchall())
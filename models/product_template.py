@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, models
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    # Por qué: Marca los productos cuya categoría o UdM cambió y todavía no se
+    # copió a las líneas de compra (ver PurchaseOrderLine._cron_sync_product_analysis_fields)
+    pesos_purchase_analysis_pending = fields.Boolean(copy=False, index=True)
+
+    def write(self, vals):
+        """Override para encolar la actualización de categoría/UdM en las líneas de compra."""
+        if {'categ_id', 'uom_id'}.intersection(vals):
+            # Tip: El flag viaja en el mismo write, sin consultas extra
+            vals = dict(vals, pesos_purchase_analysis_pending=True)
+            result = super().write(vals)
+            self.env.ref(self.env['pesos.conversion.mixin']._pesos_xmlid(
+                'ir_cron_sync_purchase_line_analysis'))._trigger()
+            return result
+        return super().write(vals)
@@ -1,16 +1,31 @@
 # -*- coding: utf-8 -*-
 
+import time
+
 from odoo import api, fields, models
+from odoo.tools.sql import column_exists, create_column
+
+from .account_move import PESOS_BACKFILL_BATCH_SIZE, PESOS_BACKFILL_TIME_LIMIT
+
+# Progreso del backfill inicial de categoría/UdM (se borra al terminar)
+PESOS_ANALYSIS_BACKFILL_PARAM = 'surtecnica_pesos.purchase_line_analysis_last_id'
+# Líneas por UPDATE al sincronizar productos modificados
+PESOS_ANALYSIS_SYNC_BATCH_SIZE = 5000
 
 
 class PurchaseOrderLine(models.Model):
-    _inherit = 'purchase.order.line'
+    _inherit = ['purchase.order.line', 'pesos.conversion.mixin']
 
     # ── Campos para análisis de reportes ──────────────────────────────────
+    # Por qué: Como related stored, recategorizar productos o cambiar su UdM
+    # recalculaba en la misma transacción todas las líneas de compra históricas.
+    # Patrón: El compute solo depende de product_id (línea nueva o producto
+    # cambiado); los cambios en el producto los aplica un cron por lotes
+    # (ver ProductTemplate.write y _cron_sync_product_analysis_fields).
     product_categ_id = fields.Many2one(
         'product.category',
         string='Categoría de Producto',
-        related='product_id.categ_id',
+        compute='_compute_product_analysis_fields',
         store=True,
         readonly=True,
     )
@@ -18,11 +33,17 @@ class PurchaseOrderLine(models.Model):
     product_uom_id = fields.Many2one(
         'uom.uom',
         string='UdM del Producto',
-        related='product_id.uom_id',
+        compute='_compute_product_analysis_fields',
         store=True,
         readonly=True,
     )
 
+    @api.depends('product_id')
+    def _compute_product_analysis_fields(self):
+        for line in self:
+            line.product_categ_id = line.product_id.categ_id
+            line.product_uom_id = line.product_id.uom_id
+
     # ── Campos para impresión en pesos ────────────────────────────────────
     # Por qué: Campo relacionado necesario para los campos Monetary que usan currency_field
     company_currency_id = fields.Many2one(
@@ -44,21 +65,140 @@ class PurchaseOrderLine(models.Model):
         currency_field='company_currency_id',
     )
 
-    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_id.currency_id', 'order_id.date_order', 'order_id.manual_currency_rate')
+    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_id.currency_id', 'order_id.date_order', 'order_id.manual_currency_rate', 'order_id.pesos_frozen_rate')
     def _compute_amounts_pesos(self):
         """Calcula precio unitario y subtotal en moneda de la compañía."""
-        for line in self:
-            if line.currency_id and line.company_id.currency_id and line.currency_id != line.company_id.currency_id:
-                # Por qué: Si hay TC manual en la orden, lo usamos; sino usamos el automático
-                if line.order_id.manual_currency_rate:
-                    line.price_unit_pesos = line.price_unit * line.order_id.manual_currency_rate
-                    line.price_subtotal_pesos = line.price_subtotal * line.order_id.manual_currency_rate
-                else:
-                    date = line.order_id.date_order or fields.Date.context_today(line)
-                    line.price_unit_pesos = line.currency_id._convert(
-                        line.price_unit, line.company_id.currency_id, line.company_id, date)
-                    line.price_subtotal_pesos = line.currency_id._convert(
-                        line.price_subtotal, line.company_id.currency_id, line.company_id, date)
-            else:
-                line.price_unit_pesos = line.price_unit
-                line.price_subtotal_pesos = line.price_subtotal
+        # Por qué: Conversión por lotes; las líneas de una misma orden comparten un solo TC
+        self._compute_pesos_amounts_batch({
+            'price_unit': 'price_unit_pesos',
+            'price_subtotal': 'price_subtotal_pesos',
+        })
+
+    def _get_pesos_conversion_key(self):
+        """Clave de conversión: si hay TC manual en la orden se usa; sino el TC de la fecha."""
+        order = self.order_id
+        return (
+            self.currency_id,
+            self.company_id.currency_id,
+            self.company_id,
+            order.date_order,
+            order.manual_currency_rate,
+            order.pesos_frozen_rate,
+        )
+
+    # ── Categoría/UdM: backfill y sincronización por lotes ────────────────
+    # Por qué: En una instalación nueva el ORM calcularía las columnas línea por
+    # línea; las creamos vacías y las completa el cron por SQL.
+    def _auto_init(self):
+        missing = [
+            column for column in ('product_categ_id', 'product_uom_id')
+            if not column_exists(self.env.cr, 'purchase_order_line', column)
+        ]
+        for column in missing:
+            create_column(self.env.cr, 'purchase_order_line', column, 'int4')
+        if missing:
+            self.env['ir.config_parameter'].sudo().set_param(PESOS_ANALYSIS_BACKFILL_PARAM, 0)
+        return super()._auto_init()
+
+    @api.model
+    def _get_product_analysis_update_sql(self, line_filter):
+        """UPDATE que copia categoría y UdM del producto a las líneas de line_filter que difieren."""
+        return f"""
+            UPDATE purchase_order_line line
+               SET product_categ_id = t.categ_id,
+                   product_uom_id = t.uom_id
+              FROM product_product p
+              JOIN product_template t ON t.id = p.product_tmpl_id
+             WHERE p.id = line.product_id
+               AND ({line_filter})
+               AND (line.product_categ_id IS DISTINCT FROM t.categ_id
+                    OR line.product_uom_id IS DISTINCT FROM t.uom_id)
+        """
+
+    @api.model
+    def _backfill_product_analysis_fields(self, last_id=0, batch_size=PESOS_BACKFILL_BATCH_SIZE):
+        """Completa por SQL categoría y UdM del siguiente lote de líneas.
+
+        Retorna el último id procesado, o 0 si no quedan registros.
+        """
+        self.env.cr.execute(
+            "SELECT id FROM purchase_order_line WHERE id > %s ORDER BY id LIMIT %s",
+            [last_id, batch_size],
+        )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        if not ids:
+            return 0
+        self.env.cr.execute(self._get_product_analysis_update_sql("line.id = ANY(%s)"), [ids])
+        self.invalidate_model(['product_categ_id', 'product_uom_id'])
+        return ids[-1]
+
+    @api.model
+    def _sync_product_analysis_fields(self, template_ids, batch_size=PESOS_ANALYSIS_SYNC_BATCH_SIZE):
+        """Actualiza hasta batch_size líneas desactualizadas de las plantillas dadas.
+
+        Retorna la cantidad de líneas actualizadas (0 cuando ya están al día).
+        """
+        # Tip: Solo toca líneas que difieren, así cada lote avanza y el proceso
+        # se retoma sin guardar progreso si el cron se corta
+        self.env.cr.execute(self._get_product_analysis_update_sql("""
+            line.id IN (
+                SELECT l.id
+                  FROM purchase_order_line l
+                  JOIN product_product lp ON lp.id = l.product_id
+                  JOIN product_template lt ON lt.id = lp.product_tmpl_id
+                 WHERE lt.id = ANY(%(template_ids)s)
+                   AND (l.product_categ_id IS DISTINCT FROM lt.categ_id
+                        OR l.product_uom_id IS DISTINCT FROM lt.uom_id)
+                 LIMIT %(limit)s
+            )
+        """), {'template_ids': list(template_ids), 'limit': batch_size})
+        self.invalidate_model(['product_categ_id', 'product_uom_id'])
+        return self.env.cr.rowcount
+
+    @api.model
+    def _cron_sync_product_analysis_fields(self, time_limit=PESOS_BACKFILL_TIME_LIMIT):
+        """Cron: backfill inicial y sincronización de productos recategorizados.
+
+        Por qué: Cada lote se confirma por separado, sin bloquear la tabla de
+        líneas; el backfill guarda su avance en ir.config_parameter y la
+        sincronización en el flag de las plantillas, así puede cortarse y retomarse.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        deadline = time.monotonic() + time_limit
+        cron_xmlid = self.env['pesos.conversion.mixin']._pesos_xmlid('ir_cron_sync_purchase_line_analysis')
+
+        last_id = params.get_param(PESOS_ANALYSIS_BACKFILL_PARAM)
+        while last_id:
+            last_id = self._backfill_product_analysis_fields(int(last_id))
+            # Tip: set_param con un valor vacío borra el parámetro
+            params.set_param(PESOS_ANALYSIS_BACKFILL_PARAM, last_id or False)
+            self.env.cr.commit()
+            if last_id and time.monotonic() > deadline:
+                self.env.ref(cron_xmlid)._trigger()
+                return
+
+        templates = self.env['product.template'].with_context(active_test=False).search(
+            [('pesos_purchase_analysis_pending', '=', True)])
+        while self._sync_product_analysis_fields(templates.ids):
+            self.env.cr.commit()
+            if time.monotonic() > deadline:
+                self.env.ref(cron_xmlid)._trigger()
+                return
+        if templates:
+            # Por qué: Solo se bajan los flags sin líneas desactualizadas; si el
+            # producto cambió otra vez durante la corrida queda pendiente
+            self.env.cr.execute("""
+                UPDATE product_template t
+                   SET pesos_purchase_analysis_pending = FALSE
+                 WHERE t.id = ANY(%s)
+                   AND NOT EXISTS (
+                        SELECT 1
+                          FROM purchase_order_line l
+                          JOIN product_product p ON p.id = l.product_id
+                         WHERE p.product_tmpl_id = t.id
+                           AND (l.product_categ_id IS DISTINCT FROM t.categ_id
+                                OR l.product_uom_id IS DISTINCT FROM t.uom_id)
+                   )
+            """, [templates.ids])
+            templates.invalidate_recordset(['pesos_purchase_analysis_pending'])
+            self.env.cr.commit()
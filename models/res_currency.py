@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+from odoo.tools.lru import LRU
+
+from .pesos_perf_stat import pesos_perf, pesos_perf_cache
+
+# Por qué: Clave del cache de TC dentro de cr.cache (vive lo que vive la transacción)
+PESOS_RATE_CACHE_KEY = 'surtecnica_pesos_rates'
+# Por qué: Tope del cache; una lista de miles de documentos usa pocas claves
+# (moneda, compañía, fecha) pero evitamos que crezca sin límite en procesos largos
+PESOS_RATE_CACHE_SIZE = 4096
+
+
+class ResCurrency(models.Model):
+    _inherit = 'res.currency'
+
+    # ── Servicio de TC compartido ─────────────────────────────────────────
+    # Por qué: Todos los _compute_amounts_pesos, onchanges y reportes del módulo
+    # piden el mismo TC (moneda, compañía, fecha) muchas veces por request.
+    # Patrón: Cache por transacción en cr.cache, acotado con LRU e invalidado
+    # cuando se escriben tasas en res.currency.rate.
+    @api.model
+    def _get_pesos_rate_cache(self):
+        """Retorna el cache LRU de TC de la transacción actual."""
+        cache = self.env.cr.cache.get(PESOS_RATE_CACHE_KEY)
+        if cache is None:
+            cache = self.env.cr.cache[PESOS_RATE_CACHE_KEY] = LRU(PESOS_RATE_CACHE_SIZE)
+        return cache
+
+    @api.model
+    def _clear_pesos_rate_cache(self):
+        """Descarta los TC cacheados en la transacción actual."""
+        self.env.cr.cache.pop(PESOS_RATE_CACHE_KEY, None)
+
+    @pesos_perf('rate_lookup')
+    def _get_pesos_rate(self, to_currency, company, date):
+        """Retorna el TC para convertir de esta moneda a to_currency en la fecha dada.
+
+        Por qué: Cada clave (moneda origen, moneda destino, compañía, fecha) se
+        resuelve una sola vez por transacción, sin importar cuántos montos se conviertan.
+        """
+        self.ensure_one()
+        if self == to_currency:
+            return 1.0
+        # Tip: date_order es Datetime; normalizamos a Date para compartir la clave del día
+        date = fields.Date.to_date(date) or fields.Date.context_today(self)
+        key = (self.id, to_currency.id, company.id, date)
+        cache = self._get_pesos_rate_cache()
+        rate = cache.get(key)
+        pesos_perf_cache(self.env, 'rate_lookup', rate is not None)
+        if rate is None:
+            # Por qué: Primero la tabla diaria de TC (búsqueda por índice); si alguna
+            # moneda no tiene fila ese día, la regla nativa de Odoo
+            rates = self.env['pesos.rate.snapshot']._get_rates(self | to_currency, company, date)
+            if self.id in rates and to_currency.id in rates and rates[self.id]:
+                rate = rates[to_currency.id] / rates[self.id]
+            else:
+                rate = self._get_conversion_rate(self, to_currency, company, date)
+            cache[key] = rate
+        return rate
+
+    def _convert_pesos(self, from_amount, to_currency, company, date):
+        """Equivalente a _convert() pero usando el TC cacheado del servicio."""
+        self.ensure_one()
+        return to_currency.round(from_amount * self._get_pesos_rate(to_currency, company, date))
+
+    @api.model
+    def _get_pesos_rate_sql(self, currency, company_currency, company, date):
+        """Retorna la expresión SQL del TC de currency a company_currency en date.
+
+        Por qué: Backfills y vistas de reporte convierten en Postgres con la misma
+        regla que _get_conversion_rate() (última tasa <= fecha, priorizando la de la compañía).
+        Los argumentos son expresiones SQL (columnas) del query que la usa.
+        Patrón: Se busca en la tabla diaria pesos_rate_snapshot (índice único); la
+        subconsulta sobre res_currency_rate solo corre si falta la fila del día
+        (la moneda de la compañía tiene filas con TC 1.0 aunque no tenga tasas).
+        """
+        rate_query = """COALESCE((
+                SELECT s.rate
+                  FROM pesos_rate_snapshot s
+                 WHERE s.company_id = {company}
+                   AND s.currency_id = {currency}
+                   AND s.date = {date}
+            ), (
+                SELECT r.rate
+                  FROM res_currency_rate r
+                 WHERE r.currency_id = {currency}
+                   AND r.name <= {date}
+                   AND (r.company_id IS NULL OR r.company_id = {company})
+              ORDER BY r.company_id, r.name DESC
+                 LIMIT 1
+            ), 1.0)"""
+        return "({} / NULLIF({}, 0))".format(
+            rate_query.format(currency=company_currency, company=company, date=date),
+            rate_query.format(currency=currency, company=company, date=date),
+        )
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+import time
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Filas del archivo por sentencia INSERT ... ON CONFLICT
+PESOS_RATE_IMPORT_CHUNK_SIZE = 5000
+# Errores de validación que se muestran como máximo
+PESOS_RATE_IMPORT_MAX_ERRORS = 20
+# Tip: Encabezados aceptados (en inglés o castellano) por columna
+PESOS_RATE_IMPORT_COLUMNS = {
+    'date': ('date', 'fecha'),
+    'currency': ('currency', 'moneda'),
+    'rate': ('rate', 'tasa'),
+    'inverse_rate': ('inverse_rate', 'tipo_cambio'),
+}
+
+
+class ResCurrencyRate(models.Model):
+    _inherit = 'res.currency.rate'
+
+    # Por qué: Si cambia una tasa, los TC cacheados por el servicio de
+    # res.currency dejan de ser válidos para el resto de la transacción, y la
+    # tabla diaria de TC debe recalcularse desde la fecha más antigua afectada
+    @api.model_create_multi
+    def create(self, vals_list):
+        rates = super().create(vals_list)
+        rates._refresh_pesos_rate_snapshot(rates.currency_id.ids, min(rates.mapped('name'), default=None))
+        return rates
+
+    def write(self, vals):
+        # Tip: Capturamos moneda y fecha previas; el tramo a recalcular empieza en la menor
+        currency_ids = self.currency_id.ids
+        date_from = min(self.mapped('name'), default=None)
+        result = super().write(vals)
+        if {'rate', 'name', 'currency_id', 'company_id'}.intersection(vals):
+            currency_ids = list(set(currency_ids) | set(self.currency_id.ids))
+            date_from = min(self.mapped('name') + ([date_from] if date_from else []), default=None)
+            self._refresh_pesos_rate_snapshot(currency_ids, date_from)
+        else:
+            self.env['res.currency']._clear_pesos_rate_cache()
+        return result
+
+    def unlink(self):
+        currency_ids = self.currency_id.ids
+        date_from = min(self.mapped('name'), default=None)
+        result = super().unlink()
+        self._refresh_pesos_rate_snapshot(currency_ids, date_from)
+        return result
+
+    @api.model
+    def _refresh_pesos_rate_snapshot(self, currency_ids, date_from):
+        """Recalcula la tabla diaria de TC, descarta los TC cacheados y encola
+        el recálculo de los documentos afectados por los días que cambiaron."""
+        if currency_ids:
+            self.env['pesos.rate.snapshot']._refresh_snapshot(currency_ids, date_from, track_changes=True)
+        else:
+            self.env['res.currency']._clear_pesos_rate_cache()
+
+    # ── Importación masiva ────────────────────────────────────────────────
+    # Por qué: Las series históricas oficiales (BCRA) son años de tasas diarias;
+    # crearlas registro por registro recalcula la tabla diaria de TC y los
+    # caches en cada create. Se valida el archivo completo y se hace un upsert
+    # por lote en SQL; al final se recalcula la tabla y se invalidan los caches
+    # una sola vez. Se ejecuta desde `odoo-bin shell`, por ejemplo:
+    #   env['res.currency.rate']._import_pesos_rates_csv('/tmp/bcra_usd.csv', currency_code='USD')
+    @api.model
+    def _import_pesos_rates_csv(self, path, company_ids=None, currency_code=None,
+                                chunk_size=PESOS_RATE_IMPORT_CHUNK_SIZE):
+        """Importa tasas desde un CSV local con upsert por lotes.
+
+        Columnas: fecha, moneda (opcional si se pasa currency_code) y tasa
+        (unidades por peso) o tipo_cambio (pesos por unidad, como publica el BCRA).
+        Retorna un dict con filas, lotes, segundos y filas por segundo.
+        """
+        start = time.monotonic()
+        companies = self.env['res.company'].browse(company_ids) if company_ids else self.env.company
+        rows = self._read_pesos_rates_csv(path, companies, currency_code)
+        if not rows:
+            raise UserError(_("El archivo %s no tiene tasas para importar.", path))
+
+        self.flush_model()
+        chunk_count = 0
+        for index in range(0, len(rows), chunk_size):
+            self._upsert_pesos_rates(rows[index:index + chunk_size], companies)
+            chunk_count += 1
+
+        # Por qué: El upsert no pasa por el ORM; descartamos lo que esté en cache
+        self.invalidate_model()
+        self.env['res.currency'].invalidate_model(['rate', 'inverse_rate'])
+        self._refresh_pesos_rate_snapshot(
+            list({currency_id for __, currency_id, __ in rows}),
+            min(date for date, __, __ in rows),
+        )
+
+        seconds = time.monotonic() - start
+        stats = {
+            'rows': len(rows) * len(companies),
+            'chunks': chunk_count,
+            'seconds': round(seconds, 2),
+            'rows_per_second': round(len(rows) * len(companies) / seconds) if seconds else 0,
+        }
+        _logger.info("Pesos rate import %s: %s", path, stats)
+        return stats
+
+    @api.model
+    def _read_pesos_rates_csv(self, path, companies, currency_code=None):
+        """Lee y valida el CSV; retorna [(fecha, id moneda, tasa)] o lanza UserError."""
+        currencies = {
+            currency.name: currency
+            for currency in self.env['res.currency'].with_context(active_test=False).search([])
+        }
+        default_currency = currencies.get(currency_code.upper()) if currency_code else None
+        if currency_code and not default_currency:
+            raise UserError(_("La moneda %s no existe.", currency_code))
+        company_currencies = companies.currency_id
+
+        rows, seen, errors = [], set(), []
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            # Tip: Las series del BCRA suelen venir separadas por ';'
+            try:
+                dialect = csv.Sniffer().sniff(file.readline(), delimiters=',;\t')
+            except csv.Error:
+                raise UserError(_("No se reconoce el separador del archivo %s.", path))
+            file.seek(0)
+            reader = csv.DictReader(file, dialect=dialect)
+            columns = self._get_pesos_rate_import_columns(reader.fieldnames or [])
+            if 'date' not in columns or not {'rate', 'inverse_rate'} & set(columns) \
+                    or ('currency' not in columns and not default_currency):
+                raise UserError(_(
+                    "El archivo debe tener las columnas fecha, moneda y tasa o tipo_cambio "
+                    "(la moneda puede indicarse aparte). Encabezados: %s", reader.fieldnames))
+
+            for line_number, record in enumerate(reader, start=2):
+                try:
+                    date = fields.Date.to_date(self._parse_pesos_import_date(record[columns['date']]))
+                    if not date:
+                        raise ValueError(_("falta la fecha"))
+                    currency = default_currency
+                    if 'currency' in columns and record[columns['currency']].strip():
+                        currency = currencies.get(record[columns['currency']].strip().upper())
+                        if not currency:
+                            raise ValueError(_("moneda desconocida %s", record[columns['currency']]))
+                    if not currency:
+                        raise ValueError(_("falta la moneda"))
+                    if currency in company_currencies:
+                        raise ValueError(_("%s es la moneda de la compañía", currency.name))
+                    if 'rate' in columns and record[columns['rate']].strip():
+                        rate = self._parse_pesos_import_number(record[columns['rate']])
+                    elif 'inverse_rate' in columns and record[columns['inverse_rate']].strip():
+                        rate = 1.0 / self._parse_pesos_import_number(record[columns['inverse_rate']])
+                    else:
+                        raise ValueError(_("falta la tasa"))
+                    if rate <= 0:
+                        raise ValueError(_("la tasa debe ser positiva"))
+                    if (date, currency.id) in seen:
+                        raise ValueError(_("tasa repetida para %s el %s", currency.name, date))
+                except (ValueError, TypeError, AttributeError, ZeroDivisionError) as e:
+                    errors.append(_("Línea %(line)s: %(error)s", line=line_number, error=e))
+                    if len(errors) >= PESOS_RATE_IMPORT_MAX_ERRORS:
+                        break
+                    continue
+                seen.add((date, currency.id))
+                rows.append((date, currency.id, rate))
+
+        if errors:
+            raise UserError(_("El archivo tiene errores, no se importó ninguna tasa:\n%s", "\n".join(errors)))
+        return rows
+
+    @api.model
+    def _get_pesos_rate_import_columns(self, fieldnames):
+        """Retorna {columna lógica: encabezado del archivo} según PESOS_RATE_IMPORT_COLUMNS."""
+        normalized = {name.strip().lower(): name for name in fieldnames if name}
+        return {
+            column: normalized[alias]
+            for column, aliases in PESOS_RATE_IMPORT_COLUMNS.items()
+            for alias in aliases
+            if alias in normalized
+        }
+
+    @api.model
+    def _parse_pesos_import_date(self, value):
+        """Acepta AAAA-MM-DD o DD/MM/AAAA."""
+        value = value.strip()
+        if '/' in value:
+            day, month, year = value.split('/')
+            return f'{year}-{int(month):02d}-{int(day):02d}'
+        return value
+
+    @api.model
+    def _parse_pesos_import_number(self, value):
+        """Acepta punto o coma decimal (con punto de miles: 1.234,56)."""
+        value = value.strip()
+        if ',' in value:
+            value = value.replace('.', '').replace(',', '.')
+        return float(value)
+
+    @api.model
+    def _upsert_pesos_rates(self, rows, companies):
+        """Inserta o actualiza un lote de tasas para todas las compañías en una sentencia."""
+        # Patrón: Mismo esquema que el upsert de pesos.perf.stat; el conflicto
+        # usa la restricción única (fecha, moneda, compañía) de res.currency.rate
+        values = [
+            (date, currency_id, company_id, rate, self.env.uid, self.env.uid)
+            for company_id in companies.ids
+            for date, currency_id, rate in rows
+        ]
+        self.env.cr.execute(f"""
+            INSERT INTO res_currency_rate (name, currency_id, company_id, rate,
+                                           create_uid, write_uid, create_date, write_date)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')"] * len(values))}
+            ON CONFLICT (name, currency_id, company_id) DO UPDATE
+               SET rate = EXCLUDED.rate,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, [value for row in values for value in row])
@@ -4,7 +4,9 @@ from odoo import api, fields, models
 
 
 class SaleOrder(models.Model):
-    _inherit = 'sale.order'
+    _inherit = ['sale.order', 'pesos.document.mixin']
+
+    _pesos_report_action = 'action_report_saleorder_pesos'
 
     # Por qué: Permite al usuario elegir imprimir en pesos aunque el presupuesto sea en USD
     print_in_pesos = fields.Boolean(
@@ -41,12 +43,12 @@ class SaleOrder(models.Model):
             # Por qué: Solo actualizar si NO hay TC manual ya establecido
             # Esto permite que el usuario edite el TC sin que se sobrescriba al cambiar la fecha
             if not order.manual_currency_rate:
-                if order.currency_id and order.company_id.currency_id and order.currency_id != order.company_id.currency_id:
+                if order.is_foreign_currency:
                     # Por qué: Obtenemos el TC de la fecha actual
                     date = order.date_order or fields.Date.context_today(order)
                     # Convertimos 1 unidad de la moneda extranjera a pesos
-                    order.manual_currency_rate = order.currency_id._convert(
-                        1.0, order.company_id.currency_id, order.company_id, date)
+                    order.manual_currency_rate = order.currency_id._get_pesos_rate(
+                        order.company_id.currency_id, order.company_id, date)
                 else:
                     order.manual_currency_rate = 0.0
 
@@ -68,113 +70,72 @@ class SaleOrder(models.Model):
         currency_field='company_currency_id',
     )
 
-    @api.depends('amount_untaxed', 'amount_tax', 'amount_total', 'currency_id', 'company_id.currency_id', 'date_order', 'manual_currency_rate')
+    @api.depends('amount_untaxed', 'amount_tax', 'amount_total', 'currency_id', 'company_id.currency_id', 'date_order', 'manual_currency_rate', 'pesos_frozen_rate')
     def _compute_amounts_pesos(self):
         """Calcula los montos en la moneda de la compañía usando la tasa manual o de la fecha del presupuesto."""
-        for order in self:
-            # Por qué: Comparamos con company_currency_id (pesos) para detectar presupuestos en USD
-            if order.currency_id and order.company_id.currency_id and order.currency_id != order.company_id.currency_id:
-                # Por qué: Si hay TC manual, lo usamos; sino usamos el automático de la fecha
-                if order.manual_currency_rate:
-                    # Conversión manual directa multiplicando por el TC
-                    order.amount_untaxed_pesos = order.amount_untaxed * order.manual_currency_rate
-                    order.amount_tax_pesos = order.amount_tax * order.manual_currency_rate
-                    order.amount_total_pesos = order.amount_total * order.manual_currency_rate
-                else:
-                    # Conversión automática usando TC de la fecha
-                    date = order.date_order or fields.Date.context_today(order)
-                    order.amount_untaxed_pesos = order.currency_id._convert(
-                        order.amount_untaxed, order.company_id.currency_id, order.company_id, date)
-                    order.amount_tax_pesos = order.currency_id._convert(
-                        order.amount_tax, order.company_id.currency_id, order.company_id, date)
-                    order.amount_total_pesos = order.currency_id._convert(
-                        order.amount_total, order.company_id.currency_id, order.company_id, date)
-            else:
-                order.amount_untaxed_pesos = order.amount_untaxed
-                order.amount_tax_pesos = order.amount_tax
-                order.amount_total_pesos = order.amount_total
-
-    def action_toggle_print_pesos(self):
-        """Toggle para el smart button de impresión en pesos."""
-        for order in self:
-            order.print_in_pesos = not order.print_in_pesos
-
-    def _is_foreign_currency(self):
-        """Retorna True si el presupuesto está en moneda extranjera."""
-        self.ensure_one()
-        return self.currency_id and self.company_id.currency_id and self.currency_id != self.company_id.currency_id
+        # Por qué: Conversión por lotes, un TC por grupo (moneda, compañía, fecha, TC manual)
+        self._compute_pesos_amounts_batch({
+            'amount_untaxed': 'amount_untaxed_pesos',
+            'amount_tax': 'amount_tax_pesos',
+            'amount_total': 'amount_total_pesos',
+        })
+
+    def _get_pesos_conversion_key(self):
+        """Clave de conversión: si hay TC manual se usa; sino el TC de la fecha del presupuesto."""
+        return (
+            self.currency_id,
+            self.company_id.currency_id,
+            self.company_id,
+            self.date_order,
+            self.manual_currency_rate,
+            self.pesos_frozen_rate,
+        )
 
     def write(self, vals):
         """Override para registrar cambios de TC en el chatter inmediatamente."""
-        # Por qué: Registrar el cambio de TC antes de guardar para comparar valores
-        for order in self:
-            if 'manual_currency_rate' in vals and order.manual_currency_rate != vals['manual_currency_rate']:
-                old_rate = order.manual_currency_rate
-                new_rate = vals['manual_currency_rate']
-                # Ejecutar el write primero
-                res = super(SaleOrder, order).write(vals)
-                # Registrar en chatter después del cambio
-                if old_rate and new_rate:
-                    order.message_post(
-                        body=f"Tipo de Cambio modificado: {old_rate:.4f} → {new_rate:.4f}",
-                        subject="Cambio de Tipo de Cambio"
-                    )
-                elif new_rate:
-                    order.message_post(
-                        body=f"Tipo de Cambio establecido: {new_rate:.4f}",
-                        subject="Tipo de Cambio"
-                    )
-                return res
-        return super(SaleOrder, self).write(vals)
+        # Por qué: Capturamos el TC anterior de todo el recordset antes del write
+        # para comparar valores, y luego hacemos un único write para todos
+        self._check_pesos_rate_editable(vals)
+        old_rates = {}
+        if 'manual_currency_rate' in vals:
+            new_rate = vals['manual_currency_rate']
+            old_rates = {
+                order.id: order.manual_currency_rate
+                for order in self
+                if order.manual_currency_rate != new_rate
+            }
+        res = super(SaleOrder, self).write(vals)
+        # Registrar en chatter después del cambio, en lote
+        if old_rates:
+            self.browse(list(old_rates))._log_currency_rate_change(old_rates, vals['manual_currency_rate'])
+        return res
 
     def action_confirm(self):
         """Override para registrar TC en chatter al confirmar."""
         # Por qué: Ejecutar confirmación estándar primero
         result = super(SaleOrder, self).action_confirm()
 
-        # Por qué: Registrar TC en chatter si es moneda extranjera
-        for order in self:
-            if order.manual_currency_rate and order._is_foreign_currency():
-                total_pesos = order.amount_total * order.manual_currency_rate
-                fecha = order.date_order.strftime('%d/%m/%Y') if order.date_order else 'N/A'
-
-                # Por qué: Usar Markup para que el HTML se renderice correctamente
-                from markupsafe import Markup
-
-                html_body = Markup(f"""<div class="alert alert-success" style="margin-bottom: 0;">
-    <h5>✓ <strong>Presupuesto Confirmado</strong></h5>
-    <hr style="margin: 8px 0;"/>
-    <table class="table table-sm table-borderless" style="margin-bottom: 0;">
-        <tr>
-            <td style="width: 40%;"><strong>Tipo de Cambio:</strong></td>
-            <td><span class="badge badge-primary" style="font-size: 13px;">{order.manual_currency_rate:.4f}</span></td>
-        </tr>
-        <tr>
-            <td><strong>Conversión:</strong></td>
-            <td>{order.currency_id.name} → {order.company_currency_id.name}</td>
-        </tr>
-        <tr>
-            <td><strong>Fecha:</strong></td>
-            <td>{fecha}</td>
-        </tr>
-        <tr>
-            <td><strong>Total Original:</strong></td>
-            <td><strong>{order.currency_id.symbol} {order.amount_total:,.2f}</strong></td>
-        </tr>
-        <tr>
-            <td><strong>Total en Pesos:</strong></td>
-            <td><strong style="color: #28a745; font-size: 14px;">{order.company_currency_id.symbol} {total_pesos:,.2f}</strong></td>
-        </tr>
-    </table>
-</div>""")
-
-                order.message_post(
-                    body=html_body,
-                    subject="Confirmación con Tipo de Cambio"
-                )
+        # Por qué: Registrar TC en chatter si es moneda extranjera (en lote)
+        self._log_rate_summary()
+        # Por qué: Al confirmar congelamos el TC efectivo; los montos en pesos
+        # posteriores (vistas, reportes, PDF) ya no buscan tasas
+        self._freeze_pesos_rate()
+
+        return result
 
+    def action_draft(self):
+        """Override para descongelar el TC al volver a borrador."""
+        result = super(SaleOrder, self).action_draft()
+        self._unfreeze_pesos_rate()
         return result
 
+    def _get_rate_summary_values(self):
+        """Valores del resumen de TC al confirmar."""
+        self.ensure_one()
+        values = self._get_rate_summary_common_values(self.date_order)
+        values.update(alert_class='alert-success', icon='✓', title='Presupuesto Confirmado')
+        return values
+
     def _prepare_invoice(self):
         """Override para copiar el TC del presupuesto a la factura."""
         # Por qué: Llamamos al método original para obtener los valores base
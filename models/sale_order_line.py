@@ -4,7 +4,7 @@ from odoo import api, fields, models
 
 
 class SaleOrderLine(models.Model):
-    _inherit = 'sale.order.line'
+    _inherit = ['sale.order.line', 'pesos.conversion.mixin']
 
     # Por qué: Campo relacionado necesario para los campos Monetary que usan currency_field
     company_currency_id = fields.Many2one(
@@ -26,21 +26,23 @@ class SaleOrderLine(models.Model):
         currency_field='company_currency_id',
     )
 
-    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_id.currency_id', 'order_id.date_order', 'order_id.manual_currency_rate')
+    @api.depends('price_unit', 'price_subtotal', 'currency_id', 'company_id.currency_id', 'order_id.date_order', 'order_id.manual_currency_rate', 'order_id.pesos_frozen_rate')
     def _compute_amounts_pesos(self):
         """Calcula precio unitario y subtotal en moneda de la compañía."""
-        for line in self:
-            if line.currency_id and line.company_id.currency_id and line.currency_id != line.company_id.currency_id:
-                # Por qué: Si hay TC manual en la orden, lo usamos; sino usamos el automático
-                if line.order_id.manual_currency_rate:
-                    line.price_unit_pesos = line.price_unit * line.order_id.manual_currency_rate
-                    line.price_subtotal_pesos = line.price_subtotal * line.order_id.manual_currency_rate
-                else:
-                    date = line.order_id.date_order or fields.Date.context_today(line)
-                    line.price_unit_pesos = line.currency_id._convert(
-                        line.price_unit, line.company_id.currency_id, line.company_id, date)
-                    line.price_subtotal_pesos = line.currency_id._convert(
-                        line.price_subtotal, line.company_id.currency_id, line.company_id, date)
-            else:
-                line.price_unit_pesos = line.price_unit
-                line.price_subtotal_pesos = line.price_subtotal
+        # Por qué: Conversión por lotes; las líneas de una misma orden comparten un solo TC
+        self._compute_pesos_amounts_batch({
+            'price_unit': 'price_unit_pesos',
+            'price_subtotal': 'price_subtotal_pesos',
+        })
+
+    def _get_pesos_conversion_key(self):
+        """Clave de conversión: si hay TC manual en la orden se usa; sino el TC de la fecha."""
+        order = self.order_id
+        return (
+            self.currency_id,
+            self.company_id.currency_id,
+            self.company_id,
+            order.date_order,
+            order.manual_currency_rate,
+            order.pesos_frozen_rate,
+        )
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import purchase_line_pesos_report
+from . import sale_line_pesos_report
+from . import account_invoice_line_pesos_report
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+
+class AccountInvoiceLinePesosReport(models.Model):
+    _name = 'account.invoice.line.pesos.report'
+    _description = 'Análisis de Líneas de Factura en Pesos'
+    _auto = False
+    _rec_name = 'move_id'
+    _order = 'invoice_date desc, id desc'
+
+    # Por qué: Mismo enfoque que purchase.line.pesos.report: vista SQL con el
+    # subtotal convertido a pesos en Postgres para pivots multimoneda.
+    move_id = fields.Many2one('account.move', string='Factura', readonly=True)
+    name = fields.Char(string='Descripción', readonly=True)
+    invoice_date = fields.Date(string='Fecha de Factura', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Empresa', readonly=True)
+    product_id = fields.Many2one('product.product', string='Producto', readonly=True)
+    product_categ_id = fields.Many2one('product.category', string='Categoría de Producto', readonly=True)
+    product_uom_id = fields.Many2one('uom.uom', string='UdM del Producto', readonly=True)
+    quantity = fields.Float(string='Cantidad', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
+    company_currency_id = fields.Many2one('res.currency', string='Moneda de la Compañía', readonly=True)
+    price_unit = fields.Monetary(string='Precio Unitario', currency_field='currency_id', readonly=True, group_operator='avg')
+    price_subtotal = fields.Monetary(string='Subtotal', currency_field='currency_id', readonly=True)
+    currency_rate = fields.Float(string='Tipo de Cambio', digits=(12, 4), readonly=True, group_operator='avg')
+    price_subtotal_pesos = fields.Monetary(string='Subtotal (Pesos)', currency_field='company_currency_id', readonly=True)
+    move_type = fields.Selection([
+        ('out_invoice', 'Factura de Cliente'),
+        ('out_refund', 'Nota de Crédito de Cliente'),
+        ('in_invoice', 'Factura de Proveedor'),
+        ('in_refund', 'Nota de Crédito de Proveedor'),
+    ], string='Tipo', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('posted', 'Publicado'),
+        ('cancel', 'Cancelado'),
+    ], string='Estado', readonly=True)
+
+    @property
+    def _table_query(self):
+        return '%s %s %s' % (self._select(), self._from(), self._where())
+
+    @api.model
+    def _get_rate_sql(self):
+        """Retorna la expresión SQL del TC efectivo de la línea.
+
+        Por qué: Misma regla que _compute_amounts_pesos: moneda local → 1,
+        TC manual de la factura si existe, TC congelado al validar, sino el TC de la fecha de factura.
+        """
+        rate_sql = self.env['res.currency']._get_pesos_rate_sql(
+            'line.currency_id', 'company.currency_id', 'line.company_id', 'COALESCE(move.invoice_date, move.date)')
+        return f"""
+            CASE
+                WHEN line.currency_id = company.currency_id THEN 1.0
+                WHEN COALESCE(move.manual_currency_rate, 0) != 0 THEN move.manual_currency_rate
+                WHEN COALESCE(move.pesos_frozen_rate, 0) != 0 THEN move.pesos_frozen_rate
+                ELSE {rate_sql}
+            END
+        """
+
+    @api.model
+    def _get_subtotal_pesos_sql(self):
+        """Retorna la expresión SQL del subtotal en pesos de la línea.
+
+        Por qué: Mismo redondeo que _compute_pesos_amounts_batch: con TC manual no se
+        redondea; con el TC automático (congelado o de la fecha) sí.
+        """
+        return """
+            CASE
+                WHEN line.currency_id != company.currency_id AND COALESCE(move.manual_currency_rate, 0) != 0
+                    THEN line.price_subtotal * conv.rate
+                ELSE ROUND(line.price_subtotal * conv.rate, company_currency.decimal_places)
+            END
+        """
+
+    @api.model
+    def _select(self):
+        # Por qué: Las notas de crédito restan, como en account.invoice.report
+        # Tip: El subtotal en pesos ya está persistido en la línea; se calcula
+        # solo en las líneas que el backfill todavía no completó
+        return f"""
+            SELECT
+                line.id AS id,
+                line.move_id AS move_id,
+                line.name AS name,
+                COALESCE(move.invoice_date, move.date) AS invoice_date,
+                move.partner_id AS partner_id,
+                line.product_id AS product_id,
+                t.categ_id AS product_categ_id,
+                t.uom_id AS product_uom_id,
+                line.quantity * sign.factor AS quantity,
+                line.company_id AS company_id,
+                line.currency_id AS currency_id,
+                company.currency_id AS company_currency_id,
+                line.price_unit AS price_unit,
+                line.price_subtotal * sign.factor AS price_subtotal,
+                conv.rate AS currency_rate,
+                COALESCE(line.price_subtotal_pesos, {self._get_subtotal_pesos_sql()}) * sign.factor AS price_subtotal_pesos,
+                move.move_type AS move_type,
+                move.state AS state
+        """
+
+    @api.model
+    def _from(self):
+        return f"""
+            FROM account_move_line line
+                JOIN account_move move ON move.id = line.move_id
+                JOIN res_company company ON company.id = line.company_id
+                JOIN res_currency company_currency ON company_currency.id = company.currency_id
+                LEFT JOIN product_product p ON p.id = line.product_id
+                LEFT JOIN product_template t ON t.id = p.product_tmpl_id
+                CROSS JOIN LATERAL (
+                    SELECT CASE WHEN move.move_type IN ('out_refund', 'in_refund') THEN -1 ELSE 1 END AS factor
+                ) sign
+                CROSS JOIN LATERAL (SELECT {self._get_rate_sql()} AS rate) conv
+        """
+
+    @api.model
+    def _where(self):
+        # Por qué: Solo líneas de producto de facturas y notas de crédito
+        return """
+            WHERE move.move_type IN ('out_invoice', 'out_refund', 'in_invoice', 'in_refund')
+              AND line.display_type = 'product'
+        """
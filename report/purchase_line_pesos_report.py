@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+
+class PurchaseLinePesosReport(models.Model):
+    _name = 'purchase.line.pesos.report'
+    _description = 'Análisis de Líneas de Compra en Pesos'
+    _auto = False
+    _rec_name = 'order_id'
+    _order = 'date_order desc, id desc'
+
+    # Por qué: El pivot sobre purchase.order.line mezclaba USD y ARS en price_subtotal
+    # y cargaba registros ORM. Este modelo es una vista SQL (como purchase.report):
+    # la conversión a pesos se hace en Postgres y el pivot agrega con un solo GROUP BY.
+    order_id = fields.Many2one('purchase.order', string='Orden de Compra', readonly=True)
+    name = fields.Text(string='Descripción', readonly=True)
+    date_order = fields.Datetime(string='Fecha de Orden', readonly=True)
+    date_planned = fields.Datetime(string='Fecha Prevista', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Proveedor', readonly=True)
+    product_id = fields.Many2one('product.product', string='Producto', readonly=True)
+    product_categ_id = fields.Many2one('product.category', string='Categoría de Producto', readonly=True)
+    product_uom_id = fields.Many2one('uom.uom', string='UdM del Producto', readonly=True)
+    product_qty = fields.Float(string='Cantidad', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
+    company_currency_id = fields.Many2one('res.currency', string='Moneda de la Compañía', readonly=True)
+    price_unit = fields.Monetary(string='Precio Unitario', currency_field='currency_id', readonly=True, group_operator='avg')
+    price_subtotal = fields.Monetary(string='Subtotal', currency_field='currency_id', readonly=True)
+    # Por qué: TC efectivo de la línea (manual de la orden o el de la fecha) para auditar la conversión
+    currency_rate = fields.Float(string='Tipo de Cambio', digits=(12, 4), readonly=True, group_operator='avg')
+    price_subtotal_pesos = fields.Monetary(string='Subtotal (Pesos)', currency_field='company_currency_id', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Solicitud de Presupuesto'),
+        ('sent', 'Solicitud Enviada'),
+        ('to approve', 'Para Aprobar'),
+        ('purchase', 'Orden de Compra'),
+        ('done', 'Bloqueada'),
+        ('cancel', 'Cancelada'),
+    ], string='Estado', readonly=True)
+
+    @property
+    def _table_query(self):
+        return '%s %s %s' % (self._select(), self._from(), self._where())
+
+    @api.model
+    def _get_rate_sql(self):
+        """Retorna la expresión SQL del TC efectivo de la línea.
+
+        Por qué: Misma regla que _compute_amounts_pesos: moneda local → 1,
+        TC manual de la orden si existe, TC congelado al confirmar, sino el TC de la fecha de la orden.
+        """
+        rate_sql = self.env['res.currency']._get_pesos_rate_sql(
+            'line.currency_id', 'company.currency_id', 'line.company_id', 'po.date_order::date')
+        return f"""
+            CASE
+                WHEN line.currency_id = company.currency_id THEN 1.0
+                WHEN COALESCE(po.manual_currency_rate, 0) != 0 THEN po.manual_currency_rate
+                WHEN COALESCE(po.pesos_frozen_rate, 0) != 0 THEN po.pesos_frozen_rate
+                ELSE {rate_sql}
+            END
+        """
+
+    @api.model
+    def _get_subtotal_pesos_sql(self):
+        """Retorna la expresión SQL del subtotal en pesos de la línea.
+
+        Por qué: Mismo redondeo que _compute_pesos_amounts_batch: con TC manual no se
+        redondea; con el TC automático (congelado o de la fecha) sí.
+        """
+        return """
+            CASE
+                WHEN line.currency_id != company.currency_id AND COALESCE(po.manual_currency_rate, 0) != 0
+                    THEN line.price_subtotal * conv.rate
+                ELSE ROUND(line.price_subtotal * conv.rate, company_currency.decimal_places)
+            END
+        """
+
+    @api.model
+    def _select(self):
+        # Tip: Categoría y UdM salen de las columnas stored de la línea, sin joins al producto
+        return f"""
+            SELECT
+                line.id AS id,
+                line.order_id AS order_id,
+                line.name AS name,
+                po.date_order AS date_order,
+                line.date_planned AS date_planned,
+                po.partner_id AS partner_id,
+                line.product_id AS product_id,
+                line.product_categ_id AS product_categ_id,
+                line.product_uom_id AS product_uom_id,
+                line.product_qty AS product_qty,
+                line.company_id AS company_id,
+                line.currency_id AS currency_id,
+                company.currency_id AS company_currency_id,
+                line.price_unit AS price_unit,
+                line.price_subtotal AS price_subtotal,
+                conv.rate AS currency_rate,
+                {self._get_subtotal_pesos_sql()} AS price_subtotal_pesos,
+                po.state AS state
+        """
+
+    @api.model
+    def _from(self):
+        return f"""
+            FROM purchase_order_line line
+                JOIN purchase_order po ON po.id = line.order_id
+                JOIN res_company company ON company.id = line.company_id
+                JOIN res_currency company_currency ON company_currency.id = company.currency_id
+                CROSS JOIN LATERAL (SELECT {self._get_rate_sql()} AS rate) conv
+        """
+
+    @api.model
+    def _where(self):
+        # Por qué: Secciones y notas no tienen montos ni producto
+        return """
+            WHERE line.display_type IS NULL
+        """
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+
+
+class SaleLinePesosReport(models.Model):
+    _name = 'sale.line.pesos.report'
+    _description = 'Análisis de Líneas de Venta en Pesos'
+    _auto = False
+    _rec_name = 'order_id'
+    _order = 'date_order desc, id desc'
+
+    # Por qué: Mismo enfoque que purchase.line.pesos.report: vista SQL con el
+    # subtotal convertido a pesos en Postgres para pivots multimoneda.
+    order_id = fields.Many2one('sale.order', string='Presupuesto', readonly=True)
+    name = fields.Text(string='Descripción', readonly=True)
+    date_order = fields.Datetime(string='Fecha de Orden', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Cliente', readonly=True)
+    user_id = fields.Many2one('res.users', string='Vendedor', readonly=True)
+    product_id = fields.Many2one('product.product', string='Producto', readonly=True)
+    product_categ_id = fields.Many2one('product.category', string='Categoría de Producto', readonly=True)
+    product_uom_id = fields.Many2one('uom.uom', string='UdM del Producto', readonly=True)
+    product_uom_qty = fields.Float(string='Cantidad', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
+    company_currency_id = fields.Many2one('res.currency', string='Moneda de la Compañía', readonly=True)
+    price_unit = fields.Monetary(string='Precio Unitario', currency_field='currency_id', readonly=True, group_operator='avg')
+    price_subtotal = fields.Monetary(string='Subtotal', currency_field='currency_id', readonly=True)
+    currency_rate = fields.Float(string='Tipo de Cambio', digits=(12, 4), readonly=True, group_operator='avg')
+    price_subtotal_pesos = fields.Monetary(string='Subtotal (Pesos)', currency_field='company_currency_id', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Presupuesto'),
+        ('sent', 'Presupuesto Enviado'),
+        ('sale', 'Orden de Venta'),
+        ('cancel', 'Cancelado'),
+    ], string='Estado', readonly=True)
+
+    @property
+    def _table_query(self):
+        return '%s %s %s' % (self._select(), self._from(), self._where())
+
+    @api.model
+    def _get_rate_sql(self):
+        """Retorna la expresión SQL del TC efectivo de la línea.
+
+        Por qué: Misma regla que _compute_amounts_pesos: moneda local → 1,
+        TC manual del presupuesto si existe, TC congelado al confirmar, sino el TC de la fecha de la orden.
+        """
+        rate_sql = self.env['res.currency']._get_pesos_rate_sql(
+            'line.currency_id', 'company.currency_id', 'line.company_id', 'so.date_order::date')
+        return f"""
+            CASE
+                WHEN line.currency_id = company.currency_id THEN 1.0
+                WHEN COALESCE(so.manual_currency_rate, 0) != 0 THEN so.manual_currency_rate
+                WHEN COALESCE(so.pesos_frozen_rate, 0) != 0 THEN so.pesos_frozen_rate
+                ELSE {rate_sql}
+            END
+        """
+
+    @api.model
+    def _get_subtotal_pesos_sql(self):
+        """Retorna la expresión SQL del subtotal en pesos de la línea.
+
+        Por qué: Mismo redondeo que _compute_pesos_amounts_batch: con TC manual no se
+        redondea; con el TC automático (congelado o de la fecha) sí.
+        """
+        return """
+            CASE
+                WHEN line.currency_id != company.currency_id AND COALESCE(so.manual_currency_rate, 0) != 0
+                    THEN line.price_subtotal * conv.rate
+                ELSE ROUND(line.price_subtotal * conv.rate, company_currency.decimal_places)
+            END
+        """
+
+    @api.model
+    def _select(self):
+        return f"""
+            SELECT
+                line.id AS id,
+                line.order_id AS order_id,
+                line.name AS name,
+                so.date_order AS date_order,
+                so.partner_id AS partner_id,
+                so.user_id AS user_id,
+                line.product_id AS product_id,
+                t.categ_id AS product_categ_id,
+                t.uom_id AS product_uom_id,
+                line.product_uom_qty AS product_uom_qty,
+                line.company_id AS company_id,
+                line.currency_id AS currency_id,
+                company.currency_id AS company_currency_id,
+                line.price_unit AS price_unit,
+                line.price_subtotal AS price_subtotal,
+                conv.rate AS currency_rate,
+                {self._get_subtotal_pesos_sql()} AS price_subtotal_pesos,
+                so.state AS state
+        """
+
+    @api.model
+    def _from(self):
+        return f"""
+            FROM sale_order_line line
+                JOIN sale_order so ON so.id = line.order_id
+                JOIN res_company company ON company.id = line.company_id
+                JOIN res_currency company_currency ON company_currency.id = company.currency_id
+                LEFT JOIN product_product p ON p.id = line.product_id
+                LEFT JOIN product_template t ON t.id = p.product_tmpl_id
+                CROSS JOIN LATERAL (SELECT {self._get_rate_sql()} AS rate) conv
+        """
+
+    @api.model
+    def _where(self):
+        # Por qué: Secciones y notas no tienen montos ni producto
+        return """
+            WHERE line.display_type IS NULL
+        """
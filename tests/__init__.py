@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import test_manual_rate
+from . import test_pesos_benchmark
+from . import test_vendor_bills
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from odoo import Command, fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+class PesosTestCommon(AccountTestInvoicingCommon):
+    """Datos y helpers compartidos por los tests del módulo."""
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        # Tip: Moneda extranjera de prueba con tasas, distinta de la moneda de la compañía
+        cls.foreign_currency = cls.currency_data['currency']
+        cls.pesos_partner = cls.partner_a
+        cls.pesos_product = cls.product_a
+
+    def _count_queries(self, func):
+        """Ejecuta func y retorna la cantidad de queries SQL (incluido el flush final)."""
+        self.env.flush_all()
+        queries_before = self.env.cr.sql_log_count
+        func()
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - queries_before
+
+    def _create_pesos_invoice(self, line_count, rate=1000.0, move_type='out_invoice'):
+        """Crea una factura en moneda extranjera con TC manual y line_count líneas iguales."""
+        # Por qué: Líneas idénticas; así el conteo de queries solo depende del camino
+        # de código y no de cuántos valores distintos haya que escribir
+        return self.env['account.move'].create({
+            'move_type': move_type,
+            'partner_id': self.pesos_partner.id,
+            'invoice_date': fields.Date.today(),
+            'currency_id': self.foreign_currency.id,
+            'manual_currency_rate': rate,
+            'invoice_line_ids': [
+                Command.create({
+                    'product_id': self.pesos_product.id,
+                    'quantity': 2,
+                    'price_unit': 10.0,
+                    'tax_ids': [Command.clear()],
+                })
+                for __ in range(line_count)
+            ],
+        })
+
+    def _create_pesos_purchase(self, line_count, rate=1000.0):
+        """Crea una orden de compra en moneda extranjera con TC manual y line_count líneas iguales."""
+        return self.env['purchase.order'].create({
+            'partner_id': self.pesos_partner.id,
+            'currency_id': self.foreign_currency.id,
+            'manual_currency_rate': rate,
+            'order_line': [
+                Command.create({
+                    'product_id': self.pesos_product.id,
+                    'name': self.pesos_product.name,
+                    'product_qty': 2,
+                    'price_unit': 10.0,
+                    'taxes_id': [Command.clear()],
+                })
+                for __ in range(line_count)
+            ],
+        })
+
+    def _create_pesos_sale(self, line_count, rate=1000.0):
+        """Crea un presupuesto en moneda extranjera con TC manual y line_count líneas iguales."""
+        # Tip: La moneda del presupuesto sale de la lista de precios
+        pricelist = self.env['product.pricelist'].create({
+            'name': 'Lista Pesos Test',
+            'currency_id': self.foreign_currency.id,
+        })
+        return self.env['sale.order'].create({
+            'partner_id': self.pesos_partner.id,
+            'pricelist_id': pricelist.id,
+            'manual_currency_rate': rate,
+            'order_line': [
+                Command.create({
+                    'product_id': self.pesos_product.id,
+                    'product_uom_qty': 2,
+                    'price_unit': 10.0,
+                    'tax_id': [Command.clear()],
+                })
+                for __ in range(line_count)
+            ],
+        })
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from ..models.account_move import PESOS_RATE_DIRTY_KEY
+from .common import PesosTestCommon
+
+# Diferencia de queries tolerada entre una factura chica y una grande
+PESOS_QUERY_TOLERANCE = 10
+
+
+@tagged('post_install', '-at_install')
+class TestManualRate(PesosTestCommon):
+
+    def test_apply_manual_rate_balances(self):
+        move = self._create_pesos_invoice(3, rate=1000.0)
+        for line in move.line_ids.filtered('amount_currency'):
+            self.assertAlmostEqual(line.balance, line.amount_currency * 1000.0)
+        self.assertAlmostEqual(move.amount_total_pesos, move.amount_total * 1000.0)
+
+    def test_apply_manual_rate_queries_flat(self):
+        """Las queries del rebalanceo no crecen con la cantidad de líneas."""
+        counts = {}
+        for line_count in (10, 200):
+            move = self._create_pesos_invoice(line_count, rate=1000.0)
+            # Tip: Cambiamos el TC sin marcar la factura para medir solo el rebalanceo
+            move.with_context(pesos_applying_manual_rate=True).manual_currency_rate = 1050.0
+            counts[line_count] = self._count_queries(move._apply_manual_currency_rate)
+            for line in move.line_ids.filtered('amount_currency'):
+                self.assertAlmostEqual(line.balance, line.amount_currency * 1050.0)
+        self.assertLessEqual(
+            abs(counts[200] - counts[10]), PESOS_QUERY_TOLERANCE,
+            f"Queries del rebalanceo: {counts}",
+        )
+
+    def test_create_manual_rate_overhead(self):
+        """Crear con TC manual cuesta un número acotado de queries más que sin TC."""
+        counts = {}
+        for rate in (0.0, 1000.0):
+            counts[rate] = self._count_queries(lambda: self._create_pesos_invoice(200, rate=rate))
+        self.assertLessEqual(
+            counts[1000.0] - counts[0.0], PESOS_QUERY_TOLERANCE * 3,
+            f"Queries del create sin/con TC manual: {counts}",
+        )
+
+    def test_rate_edit_and_post_queries_flat(self):
+        """Cambiar el TC y validar no repiten el rebalanceo por línea."""
+        counts = {'rate_edit': {}, 'post': {}}
+        for line_count in (10, 200):
+            move = self._create_pesos_invoice(line_count, rate=1000.0)
+
+            def rate_edit():
+                move.manual_currency_rate = 1050.0
+
+            counts['rate_edit'][line_count] = self._count_queries(rate_edit)
+            counts['post'][line_count] = self._count_queries(move.action_post)
+            self.assertEqual(move.state, 'posted')
+            for line in move.line_ids.filtered('amount_currency'):
+                self.assertAlmostEqual(line.balance, line.amount_currency * 1050.0)
+        for step, step_counts in counts.items():
+            self.assertLessEqual(
+                abs(step_counts[200] - step_counts[10]), PESOS_QUERY_TOLERANCE,
+                f"Queries de {step}: {step_counts}",
+            )
+
+    def test_savepoint_inside_write_does_not_rebalance(self):
+        """Un savepoint a mitad de un write no aplica el TC; se aplica al salir."""
+        move = self._create_pesos_invoice(3, rate=1000.0)
+        line = move.invoice_line_ids[0]
+        with move._manual_currency_rate_scope():
+            move.manual_currency_rate = 1050.0
+            with self.env.cr.savepoint():
+                pass
+            self.assertAlmostEqual(line.balance, line.amount_currency * 1000.0)
+        self.assertAlmostEqual(line.balance, line.amount_currency * 1050.0)
+
+    def test_lines_without_manual_rate_not_marked(self):
+        """Líneas de facturas sin TC manual o en moneda local no se marcan pendientes."""
+        move = self._create_pesos_invoice(3, rate=0.0)
+        local_move = self._create_pesos_invoice(3, rate=1000.0)
+        local_move.currency_id = local_move.company_currency_id
+        self.env.flush_all()
+        self.env.cr.cache.pop(PESOS_RATE_DIRTY_KEY, None)
+        (move | local_move).invoice_line_ids.write({'quantity': 3})
+        self.assertFalse(self.env.cr.cache.get(PESOS_RATE_DIRTY_KEY))
+
+    def test_frozen_rate_not_editable(self):
+        """Validada la factura, su TC manual no cambia hasta volverla a borrador."""
+        move = self._create_pesos_invoice(2, rate=1000.0)
+        move.action_post()
+        with self.assertRaises(UserError):
+            move.manual_currency_rate = 1050.0
+        move.button_draft()
+        move.manual_currency_rate = 1050.0
+        self.assertFalse(move.pesos_rate_source)
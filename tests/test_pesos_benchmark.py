@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import PesosTestCommon
+
+_logger = logging.getLogger(__name__)
+
+# Por qué: Tamaños de documento de la suite; cubren desde el caso típico hasta
+# las órdenes de importación de miles de líneas
+PESOS_BENCHMARK_SIZES = (10, 100, 1000, 5000)
+# Líneas del recordset que compara el cálculo por lotes contra registro por registro
+PESOS_BENCHMARK_BATCH_SIZE = 10000
+
+
+@tagged('pesos_benchmark', '-standard', '-at_install', 'post_install')
+class TestPesosBenchmark(PesosTestCommon):
+    """Benchmark de los caminos de conversión a pesos sobre datos sintéticos.
+
+    Por qué: Fuera de la suite estándar (tarda minutos con 5000 líneas); se
+    ejecuta a pedido con --test-tags pesos_benchmark y deja un JSON con tiempo
+    y queries por documento, tamaño y paso, comparable entre versiones.
+    """
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.benchmark_results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        module = cls.env['ir.module.module'].search([('name', '=', cls.test_module)], limit=1)
+        payload = {
+            'module_version': module.latest_version,
+            'database': cls.env.cr.dbname,
+            'date': fields.Datetime.to_string(fields.Datetime.now()),
+            'results': cls.benchmark_results,
+        }
+        output_path = os.environ.get('PESOS_BENCHMARK_OUTPUT') or os.path.join(
+            tempfile.gettempdir(), f'pesos_benchmark_{module.latest_version or "dev"}.json')
+        with open(output_path, 'w', encoding='utf-8') as output:
+            json.dump(payload, output, indent=2, sort_keys=True)
+        _logger.info("Benchmark pesos: resultados en %s", output_path)
+        super().tearDownClass()
+
+    # ── Medición ──────────────────────────────────────────────────────────
+    def _measure(self, func):
+        """Ejecuta func y retorna {seconds, queries} (incluido el flush final)."""
+        start = time.perf_counter()
+        queries = self._count_queries(func)
+        return {'seconds': time.perf_counter() - start, 'queries': queries}
+
+    def _measure_compute(self, records):
+        """Función que recalcula los campos en pesos de records desde cero.
+
+        Por qué: Llamar _compute_amounts_pesos() fuera de un cómputo protegido
+        convierte cada asignación en un write() con sus overrides; marcamos los
+        campos para recalcular (stored) o los invalidamos (no stored) y los leemos.
+        """
+        fields_to_compute = [
+            field for field in records._fields.values()
+            if field.compute == '_compute_amounts_pesos'
+        ]
+
+        def compute():
+            self.env['res.currency']._clear_pesos_rate_cache()
+            for field in fields_to_compute:
+                if field.store:
+                    self.env.add_to_compute(field, records)
+                else:
+                    records.invalidate_recordset([field.name])
+            for field in fields_to_compute:
+                records.mapped(field.name)
+        return compute
+
+    def _measure_render(self, records):
+        """Función que renderiza (HTML QWeb, sin wkhtmltopdf) el reporte en pesos de records."""
+        report = self.env.ref(records._pesos_xmlid(records._pesos_report_action))
+        return lambda: self.env['ir.actions.report']._render_qweb_html(report.report_name, records.ids)
+
+    def _run_benchmark(self, document, create, steps):
+        """Mide steps(documento) para cada tamaño, revirtiendo los datos entre tamaños."""
+        for line_count in PESOS_BENCHMARK_SIZES:
+            with self.subTest(line_count=line_count):
+                with self.env.cr.savepoint() as savepoint:
+                    record = create(line_count)
+                    self.benchmark_results.setdefault(document, {})[str(line_count)] = {
+                        name: self._measure(func) for name, func in steps(record)
+                    }
+                    savepoint.rollback()
+                self.env.invalidate_all()
+                self.env['res.currency']._clear_pesos_rate_cache()
+
+    # ── Documentos ────────────────────────────────────────────────────────
+    # Patrón: Líneas y encabezado se miden por separado; cada modelo calcula
+    # sus propios campos y un recordset no puede mezclar modelos.
+    def test_benchmark_sale_order(self):
+        self._run_benchmark('sale.order', self._create_pesos_sale, lambda order: [
+            ('compute_lines', self._measure_compute(order.order_line)),
+            ('compute_header', self._measure_compute(order)),
+            ('confirm', order.action_confirm),
+            ('render', self._measure_render(order)),
+        ])
+
+    def test_benchmark_purchase_order(self):
+        self._run_benchmark('purchase.order', self._create_pesos_purchase, lambda order: [
+            ('compute_lines', self._measure_compute(order.order_line)),
+            ('compute_header', self._measure_compute(order)),
+            ('confirm', order.button_confirm),
+            ('render', self._measure_render(order)),
+        ])
+
+    def test_benchmark_invoice(self):
+        def apply_manual_rate(move):
+            # Tip: Cambiamos el TC sin marcar la factura para medir solo el rebalanceo
+            move.with_context(pesos_applying_manual_rate=True).manual_currency_rate = 1050.0
+            move._apply_manual_currency_rate()
+
+        self._run_benchmark('account.move', self._create_pesos_invoice, lambda move: [
+            ('compute_lines', self._measure_compute(move.line_ids)),
+            ('compute_header', self._measure_compute(move)),
+            ('apply_manual_currency_rate', lambda: apply_manual_rate(move)),
+            ('convert_tax_totals_to_pesos', lambda: move._convert_tax_totals_to_pesos(move.tax_totals)),
+            ('post', move.action_post),
+            ('render', self._measure_render(move)),
+        ])
+
+    def test_benchmark_batch_vs_per_record(self):
+        """Sobre PESOS_BENCHMARK_BATCH_SIZE líneas el cálculo por lotes es más rápido y hace menos queries."""
+        lines = self._create_pesos_purchase(PESOS_BENCHMARK_BATCH_SIZE).order_line
+        pesos_fields = ['price_unit_pesos', 'price_subtotal_pesos']
+
+        def per_record():
+            # Tip: with_prefetch() limita el cálculo a un registro por vez (camino anterior)
+            for line in lines:
+                line.with_prefetch(line.ids).price_subtotal_pesos
+
+        def batch():
+            lines.mapped('price_subtotal_pesos')
+
+        results = {'line_count': len(lines)}
+        for name, func in (('per_record', per_record), ('batch', batch)):
+            self.env['res.currency']._clear_pesos_rate_cache()
+            lines.invalidate_recordset(pesos_fields)
+            results[name] = self._measure(func)
+        results['speedup'] = results['per_record']['seconds'] / (results['batch']['seconds'] or 1e-9)
+        results['query_ratio'] = results['per_record']['queries'] / (results['batch']['queries'] or 1)
+        self.benchmark_results['batch_vs_per_record'] = results
+        _logger.info(
+            "Benchmark pesos (%s líneas): por registro %.3fs / %s queries, por lotes %.3fs / %s queries (x%.1f)",
+            len(lines), results['per_record']['seconds'], results['per_record']['queries'],
+            results['batch']['seconds'], results['batch']['queries'], results['speedup'],
+        )
+        self.assertLess(results['batch']['queries'], results['per_record']['queries'])
+        self.assertGreater(results['speedup'], 1.0, f"Sin aceleración por lotes: {results}")
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import PesosTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestVendorBills(PesosTestCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        # Tip: Facturamos lo pedido (sin recepción) para no depender de stock
+        cls.pesos_product.purchase_method = 'purchase'
+
+    def _create_bills_queries(self, order_count, line_count=5):
+        """Retorna (queries, facturas) de facturar order_count órdenes confirmadas a la vez."""
+        orders = self.env['purchase.order']
+        for __ in range(order_count):
+            orders |= self._create_pesos_purchase(line_count, rate=1000.0)
+        orders.button_confirm()
+        queries = self._count_queries(orders.action_create_invoice)
+        return queries, orders.invoice_ids
+
+    def test_bills_carry_manual_rate(self):
+        __, bills = self._create_bills_queries(2)
+        self.assertEqual(len(bills), 2)
+        for bill in bills:
+            self.assertEqual(bill.manual_currency_rate, 1000.0)
+            for line in bill.line_ids.filtered('amount_currency'):
+                self.assertAlmostEqual(line.balance, line.amount_currency * 1000.0)
+
+    def test_bills_queries_per_order_decrease(self):
+        """El TC se aplica en una sola pasada: las queries por orden bajan con la selección."""
+        single, __ = self._create_bills_queries(1)
+        multiple, __ = self._create_bills_queries(10)
+        self.assertLess(
+            multiple / 10, single,
+            f"Queries por orden: 1 orden {single}, 10 órdenes {multiple / 10:.1f}",
+        )